@@ -0,0 +1,321 @@
+### LOCAL MICROSOFT GRAPH STAND-IN: A SYNTHETIC DRIVE SERVED OVER HTTP FOR BENCHMARKS ###
+
+import io, csv, hashlib, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+PAGE_SIZE = 200  # Graph's collection page size
+DRIVE_ID = "bench-drive"
+SITE_ID = "bench-site"
+EPOCH = 1_700_000_000
+DEFAULT_MIX = {".txt": 0.7, ".csv": 0.25, ".mp3": 0.05}
+MIME_TYPES = {".txt": "text/plain", ".csv": "text/csv", ".mp3": "audio/mpeg"}
+TOP_FOLDERS = ["Finance", "HR", "Legal", "Operations"]
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "po", "da", "fi", "gu", "he", "ja", "qu"]
+
+
+def opaque_id(kind: str, number: int) -> str:
+    # Graph ids say nothing about the item's name or location; nor do these.
+    return "01" + hashlib.sha1(f"{kind}:{number}".encode("utf-8")).hexdigest()[:32].upper()
+
+
+def vocabulary(size: int = 3000, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class SyntheticDrive:
+    # A drive of `files` files spread over `folders` folders (two levels deep,
+    # e.g. "HR/folder001"), with the given extension mix. Content is generated
+    # from (item id, version) on demand, so any corpus size costs no memory.
+    # Every mutation gets a sequence number, which is what delta links point at.
+    # As in Graph, folder ids are opaque, delta items carry only their parent's
+    # id, and children listings and item lookups also carry its path.
+
+    def __init__(self, files: int, mix: Optional[Dict[str, float]] = None, folders: int = 20,
+                 file_kb: int = 8, seed: int = 1):
+        self.mix = mix or DEFAULT_MIX
+        self.folders = max(1, folders)
+        self.file_kb = file_kb
+        self.words = vocabulary()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.items: Dict[str, dict] = {}    # live files
+        self.changes: Dict[str, int] = {}   # item id -> seq of its last change (including deletion)
+        self.deleted: set = set()
+        self._next_id = 0
+        self.root = {"id": opaque_id("root", 0), "name": "root", "root": {}, "folder": {"childCount": 0}}
+        self.folder_items: Dict[str, dict] = {self.root["id"]: self.root}
+        self.folder_paths: Dict[str, str] = {self.root["id"]: ""}
+        tops = [self._new_folder(name, self.root["id"]) for name in TOP_FOLDERS[:self.folders]]
+        self.leaf_folders = [self._new_folder(f"folder{i:03d}", tops[i % len(tops)]) for i in range(self.folders)]
+        self.add(files)
+
+    def _new_folder(self, name: str, parent_id: str) -> str:
+        folder_id = opaque_id("folder", len(self.folder_items))
+        self.folder_items[folder_id] = {
+            "id": folder_id,
+            "name": name,
+            "folder": {"childCount": 0},  # non-empty, like "file": ingest tests the facet's truthiness
+            "parentReference": {"id": parent_id},
+            "lastModifiedDateTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(EPOCH)),
+        }
+        self.folder_items[parent_id]["folder"]["childCount"] += 1
+        parent_path = self.folder_paths[parent_id]
+        self.folder_paths[folder_id] = f"{parent_path}/{name}" if parent_path else name
+        return folder_id
+
+    def folder_path(self, item_id: str) -> str:
+        # Drive-relative path of a file's folder, e.g. "HR/folder001".
+        return self.folder_paths[self.items[item_id]["parentReference"]["id"]]
+
+    def _new_item(self, ext: str) -> dict:
+        number = self._next_id
+        self._next_id += 1
+        item_id = f"item{number:07d}"
+        folder = self.leaf_folders[number % self.folders]
+        name = f"doc{number:07d}{ext}"
+        return {
+            "id": item_id,
+            "name": name,
+            "webUrl": f"https://bench.sharepoint.local/{self.folder_paths[folder]}/{name}",
+            "parentReference": {"id": folder},
+            # Ingest tells files from folders by this facet, so it must not be empty.
+            "file": {"mimeType": MIME_TYPES.get(ext, "application/octet-stream")},
+            "version": 0,
+        }
+
+    def _touch(self, item: dict):
+        self.seq += 1
+        item["version"] += 1
+        item["eTag"] = item["cTag"] = f"\"{item['id']}-{item['version']}\""
+        # One second per change keeps timestamps unique and runs reproducible.
+        item["lastModifiedDateTime"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(EPOCH + self.seq))
+        item["size"] = len(self.content(item["id"], item))
+        self.changes[item["id"]] = self.seq
+
+    def add(self, count: int) -> List[str]:
+        exts, weights = zip(*self.mix.items())
+        with self._lock:
+            added = []
+            for _ in range(count):
+                item = self._new_item(self._rng.choices(exts, weights)[0])
+                self.items[item["id"]] = item
+                self.folder_items[item["parentReference"]["id"]]["folder"]["childCount"] += 1
+                self._touch(item)
+                added.append(item["id"])
+            return added
+
+    def modify(self, count: int) -> List[str]:
+        with self._lock:
+            chosen = self._rng.sample(sorted(self.items), min(count, len(self.items)))
+            for item_id in chosen:
+                self._touch(self.items[item_id])
+            return chosen
+
+    def delete(self, count: int) -> List[str]:
+        with self._lock:
+            chosen = self._rng.sample(sorted(self.items), min(count, len(self.items)))
+            for item_id in chosen:
+                self.folder_items[self.items[item_id]["parentReference"]["id"]]["folder"]["childCount"] -= 1
+                del self.items[item_id]
+                self.seq += 1
+                self.changes[item_id] = self.seq
+                self.deleted.add(item_id)
+            return chosen
+
+    def code(self, item_id: str) -> str:
+        # One exact identifier per file, for lexical-match queries.
+        return f"PO-{int(item_id[4:]) + 1000}"
+
+    def content(self, item_id: str, item: Optional[dict] = None) -> bytes:
+        item = item or self.items[item_id]
+        rng = random.Random(f"{item_id}:{item['version']}")
+        target = self.file_kb * 1024
+        if item["name"].endswith(".csv"):
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerow(["order", "customer", "status", "amount", "notes"])
+            row = 0
+            while out.tell() < target:
+                row += 1
+                writer.writerow([self.code(item_id) if row == 1 else f"PO-{rng.randint(1, 99999)}",
+                                 rng.choice(self.words).title(), rng.choice(["open", "shipped", "closed"]),
+                                 rng.randint(10, 50000), " ".join(rng.choices(self.words, k=6))])
+            return out.getvalue().encode("utf-8")
+        if item["name"].endswith(".mp3"):
+            return bytes(rng.getrandbits(8) for _ in range(min(target, 4096)))  # StubTranscriber ignores the bytes
+        paragraphs, length = [f"Reference {self.code(item_id)} version {item['version']}."], 0
+        while length < target:
+            paragraph = " ".join(rng.choices(self.words, k=rng.randint(40, 120))).capitalize() + "."
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs).encode("utf-8")
+
+    def public(self, item: dict, with_path: bool = False) -> dict:
+        # Delta responses leave out parentReference.path; listings and lookups have it.
+        public = {key: value for key, value in item.items() if key != "version"}
+        if with_path and "parentReference" in item:
+            parent_path = self.folder_paths[item["parentReference"]["id"]]
+            public["parentReference"] = {**item["parentReference"],
+                                         "path": "/drive/root:" + (f"/{parent_path}" if parent_path else "")}
+        return public
+
+    def lookup(self, item_id: str) -> Optional[dict]:
+        if item_id == "root":
+            return self.root
+        return self.items.get(item_id) or self.folder_items.get(item_id)
+
+    def children(self, folder_id: str) -> List[dict]:
+        with self._lock:
+            folder_id = self.root["id"] if folder_id == "root" else folder_id
+            return [self.public(item, with_path=True)
+                    for item in list(self.folder_items.values()) + list(self.items.values())
+                    if (item.get("parentReference") or {}).get("id") == folder_id]
+
+    def _ancestors(self, item: dict) -> List[str]:
+        ancestors = []
+        parent_id = (item.get("parentReference") or {}).get("id")
+        while parent_id:
+            ancestors.append(parent_id)
+            parent_id = (self.folder_items[parent_id].get("parentReference") or {}).get("id")
+        return ancestors
+
+    def delta(self, since: Optional[int]) -> List[dict]:
+        # Folders come before the files in them. A full enumeration lists every
+        # folder; an incremental one lists the ancestors of changed files, as
+        # Graph does when a change bubbles up.
+        with self._lock:
+            if since is None:
+                return [self.public(item) for item in list(self.folder_items.values()) + list(self.items.values())]
+            folders, changed = {}, []
+            for item_id, seq in self.changes.items():
+                if seq <= since:
+                    continue
+                if item_id in self.items:
+                    item = self.items[item_id]
+                    for folder_id in reversed(self._ancestors(item)):
+                        folders.setdefault(folder_id, self.public(self.folder_items[folder_id]))
+                    changed.append(self.public(item))
+                else:
+                    changed.append({"id": item_id, "deleted": {"state": "deleted"}})
+            return list(folders.values()) + changed
+
+
+class FakeGraphServer:
+    # Serves the handful of Graph endpoints graph_client/create_vectordb use:
+    # token, site/drive lookup, children, delta (with paging and delta links),
+    # item metadata and content. `latency_ms` delays every response to
+    # approximate a real network round-trip.
+
+    def __init__(self, drive: SyntheticDrive, latency_ms: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.drive = drive
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def graph_url(self) -> str:
+        return f"{self.base_url}/v1.0"
+
+    def start(self) -> "FakeGraphServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-graph", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _page(self, items: List[dict], url, extra: dict) -> dict:
+        query = parse_qs(url.query)
+        skip = int(query.get("skip", ["0"])[0])
+        page = {"value": items[skip:skip + PAGE_SIZE]}
+        if skip + PAGE_SIZE < len(items):
+            params = "&".join(f"{key}={values[0]}" for key, values in query.items() if key != "skip")
+            page["@odata.nextLink"] = f"{self.base_url}{url.path}?{params}&skip={skip + PAGE_SIZE}".replace("?&", "?")
+        else:
+            page.update(extra)
+        return page
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, payload: dict, status: int = 200):
+                self._send(status, json.dumps(payload).encode("utf-8"))
+
+            def do_POST(self):
+                server.requests += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                if self.path.endswith("/oauth2/v2.0/token"):
+                    return self._json({"access_token": "bench-token", "expires_in": 3600, "token_type": "Bearer"})
+                self._json({"error": {"code": "notSupported"}}, 404)
+
+            def do_GET(self):
+                server.requests += 1
+                url = urlparse(self.path)
+                parts = url.path.split("/")[2:]  # drop "" and "v1.0"
+                drive = server.drive
+                if url.path.startswith("/v1.0/sites/root:"):
+                    return self._json({"id": SITE_ID})
+                if parts[:3] == ["sites", SITE_ID, "drive"]:
+                    return self._json({"id": DRIVE_ID})
+                if parts[:2] != ["drives", DRIVE_ID]:
+                    return self._json({"error": {"code": "itemNotFound"}}, 404)
+
+                rest = parts[2:]
+                if rest == ["root", "delta"]:
+                    token = parse_qs(url.query).get("token", [None])[0]
+                    since = int(token) if token is not None else None
+                    items = drive.delta(since)
+                    delta_link = f"{server.graph_url}/drives/{DRIVE_ID}/root/delta?token={drive.seq}"
+                    return self._json(server._page(items, url, {"@odata.deltaLink": delta_link}))
+                if len(rest) == 3 and rest[0] == "items" and rest[2] == "children":
+                    return self._json(server._page(drive.children(rest[1]), url, {}))
+                if len(rest) >= 2 and rest[0] == "items":
+                    item = drive.lookup(rest[1])
+                    if item is None:
+                        return self._json({"error": {"code": "itemNotFound"}}, 404)
+                    if len(rest) == 3 and rest[2] == "content":
+                        if rest[1] not in drive.items:
+                            return self._json({"error": {"code": "notSupported"}}, 400)
+                        return self._send(200, drive.content(rest[1]), "application/octet-stream")
+                    return self._json(drive.public(item, with_path=True))
+                self._json({"error": {"code": "invalidRequest"}}, 400)
+
+        return Handler
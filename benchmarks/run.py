@@ -0,0 +1,349 @@
+### OFFLINE BENCHMARKS: INGEST THROUGHPUT, INCREMENTAL SYNC, WEBHOOK BURSTS AND QUERY LATENCY ###
+#
+#   python benchmarks/run.py --sizes 100,1000,5000 --output bench.json
+#
+# Each corpus size runs in its own subprocess and scratch directory against a
+# local fake Graph server (fake_graph.py), with the deterministic fake
+# embedder, the fake LLM provider and the stub transcriber, so no network or
+# API key is needed. The only exception is tiktoken, which downloads its
+# encoding on first use. Pre-fill TIKTOKEN_CACHE_DIR for fully offline runs.
+
+import os, sys, json, argparse, random, resource, shutil, subprocess, tempfile, threading, time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class RSSSampler:
+    # Peak resident memory of this process plus all its descendants (the
+    # parse pool's forkserver and workers), sampled from /proc. Where /proc is
+    # unavailable only this process's own peak (ru_maxrss) is reported.
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @staticmethod
+    def tree_rss_kb(root: int) -> int:
+        parents, rss = {}, {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/status", "r") as f:
+                    for line in f:
+                        if line.startswith("PPid:"):
+                            parents[int(entry)] = int(line.split()[1])
+                        elif line.startswith("VmRSS:"):
+                            rss[int(entry)] = int(line.split()[1])
+            except (OSError, ValueError):
+                continue
+        total = 0
+        for pid in rss:
+            ancestor = pid
+            while ancestor and ancestor != root:
+                ancestor = parents.get(ancestor, 0)
+            if ancestor == root:
+                total += rss[pid]
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self.tree_rss_kb(os.getpid()))
+            self._stop.wait(self.interval)
+
+    def start(self) -> "RSSSampler":
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        own_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+        return round(max(self.peak_kb, own_kb) / 1024, 1)
+
+
+def stage_totals() -> Dict[str, float]:
+    # Seconds per stage from the metrics registry, summed since the last reset.
+    from metrics import registry
+    totals = {}
+    for key, (_, total, _) in registry.histograms.get("stage_seconds", {}).items():
+        stage = dict(key)["stage"]
+        totals[stage] = round(totals.get(stage, 0.0) + total, 3)
+    return totals
+
+
+def reset_metrics():
+    from metrics import registry
+    registry.reset()
+
+
+def counter(name: str) -> float:
+    from metrics import registry
+    return sum(registry.counters.get(name, {}).values())
+
+
+def timed_sync(main, **extra) -> dict:
+    reset_metrics()
+    started = time.perf_counter()
+    main()
+    seconds = time.perf_counter() - started
+    files = counter("files_total")
+    chunks = counter("chunks_written_total")
+    return {
+        "seconds": round(seconds, 3),
+        "files": int(files),
+        "chunks": int(chunks),
+        "files_per_s": round(files / seconds, 2) if seconds else 0.0,
+        "chunks_per_s": round(chunks / seconds, 2) if seconds else 0.0,
+        "bytes_downloaded": int(counter("bytes_downloaded_total")),
+        "preload_misses": int(counter("parse_preload_misses_total")),
+        "stages": stage_totals(),
+        **extra,
+    }
+
+
+def webhook_burst(drive, burst: int) -> dict:
+    # `burst` item-level notifications arriving back to back, as a bulk upload
+    # would produce; reports how many sync runs they coalesced into and how
+    # long until the last change was indexed.
+    from create_vectordb import reindex_from_notifications
+    from sync_queue import CoalescingQueue
+
+    reset_metrics()
+    changed = drive.modify(burst)
+    queue = CoalescingQueue(reindex_from_notifications, state_file="bench_sync_queue.json")
+    started = time.perf_counter()
+    for item_id in changed:
+        queue.enqueue([{"resource": f"drives/{drive_id()}/items/{item_id}", "resourceData": {"id": item_id}}])
+    while True:
+        stats = queue.stats()
+        if not stats["depth"] and not stats["running"] and stats["runs"]:
+            break
+        time.sleep(0.05)
+    seconds = time.perf_counter() - started
+    return {
+        "notifications": len(changed),
+        "runs": stats["runs"],
+        "failures": stats["failures"],
+        "seconds": round(seconds, 3),
+        "files": int(counter("files_total")),
+        "stages": stage_totals(),
+    }
+
+
+def drive_id() -> str:
+    from fake_graph import DRIVE_ID
+    return DRIVE_ID
+
+
+def query_latency(drive, queries: int, seed: int = 3) -> dict:
+    from langchain_chroma import Chroma
+    from embedding_cache import get_embedding_model
+    from generation import build_messages, stream_answer
+    from index_state import active_collection, read_index_version
+    from retrieval import BM25Index, HybridRetriever, bm25_path, build_where
+
+    collection = active_collection(read_index_version())
+    db = Chroma(collection_name=collection, persist_directory="chroma_db",
+                embedding_function=get_embedding_model(cached=False))
+    retriever = HybridRetriever(db, BM25Index(bm25_path(collection)))
+
+    # Half exact-code lookups (whose target file is known), half free-text
+    # questions from the corpus vocabulary.
+    rng = random.Random(seed)
+    item_ids = sorted(item_id for item_id, item in drive.items.items() if not item["name"].endswith(".mp3"))
+    questions = []
+    for index in range(queries):
+        if index % 2 and item_ids:
+            target = rng.choice(item_ids)
+            questions.append((f"What is the status of {drive.code(target)}?", target))
+        else:
+            questions.append(("Tell me about " + " ".join(rng.choices(drive.words, k=4)), None))
+
+    reset_metrics()
+    retrieval, answer, hits = [], [], 0
+    for question, _ in questions:
+        started = time.perf_counter()
+        results = retriever.retrieve(question)
+        retrieved = time.perf_counter()
+        retrieval.append(retrieved - started)
+        if results:
+            hits += 1
+            messages = build_messages(question, [chunk.doc.page_content for chunk in results], [])
+            "".join(stream_answer(messages, provider="fake"))
+            answer.append(time.perf_counter() - started)
+
+    # The code lookups again, unscoped and scoped to the target's folder path
+    # (the same filter the scope UI builds): latency and how often the target
+    # file is the top result.
+    lookups = [(question, target) for question, target in questions if target]
+    scoped = {"unscoped": ([], 0), "folder": ([], 0)}
+    for label in scoped:
+        samples, found = scoped[label]
+        for question, target in lookups:
+            where = build_where(folders=[drive.folder_path(target)]) if label == "folder" else None
+            started = time.perf_counter()
+            results = retriever.retrieve(question, where=where)
+            samples.append(time.perf_counter() - started)
+            found += bool(results) and results[0].doc.metadata.get("file_id") == target
+        scoped[label] = (samples, found)
+
+    def summary(samples):
+        return {"p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "count": len(samples)}
+
+    scoped_lookup = {
+        label: {**summary(samples), "top1_hit_rate": round(found / len(samples), 3) if samples else 0.0}
+        for label, (samples, found) in scoped.items()
+    }
+    return {"queries": queries, "with_results": hits, "retrieval": summary(retrieval),
+            "answer": summary(answer), "scoped_lookup": scoped_lookup, "stages": stage_totals()}
+
+
+def worker(config: dict):
+    # Runs inside the scratch directory; everything create_vectordb writes
+    # (chroma_db/, manifest, caches, spool) lands there.
+    sys.path[:0] = [REPO_DIR, BENCH_DIR]
+    from fake_graph import FakeGraphServer, SyntheticDrive
+
+    drive = SyntheticDrive(config["size"], config["mix"], folders=config["folders"], file_kb=config["file_kb"])
+    server = FakeGraphServer(drive, latency_ms=config["graph_latency_ms"]).start()
+    os.environ.update({
+        "GRAPH_URL": server.graph_url,
+        "GRAPH_LOGIN_URL": server.base_url,
+        "TENANT_ID": "bench-tenant",
+        "CLIENT_ID": "bench-client",
+        "CLIENT_SECRET": "bench-secret",
+        "SITE_URL_NEW": "https://bench.sharepoint.local/sites/bench",
+    })
+
+    import create_vectordb
+
+    sampler = RSSSampler().start()
+    results = {"size": config["size"]}
+    results["initial"] = timed_sync(create_vectordb.main)
+    if not results["initial"]["files"] or not results["initial"]["chunks"]:
+        # Every later phase would measure an empty index.
+        raise SystemExit(f"Initial ingest indexed {results['initial']['files']} file(s) and "
+                         f"{results['initial']['chunks']} chunk(s) out of {config['size']}")
+    if results["initial"]["preload_misses"]:
+        # Workers importing langchain/chromadb themselves would dominate parse time.
+        raise SystemExit(f"{results['initial']['preload_misses']} parse worker(s) started without the "
+                         f"preloaded create_vectordb; check PYTHONPATH")
+
+    changes = max(1, int(config["size"] * config["change_fraction"]))
+    drive.modify(changes)
+    drive.add(max(1, changes // 5))
+    drive.delete(max(1, changes // 5))
+    results["incremental"] = timed_sync(create_vectordb.main, changed_files=changes + 2 * max(1, changes // 5))
+
+    results["webhook_burst"] = webhook_burst(drive, config["burst"])
+    results["query"] = query_latency(drive, config["queries"])
+    results["graph_requests"] = server.requests
+    results["peak_rss_mb"] = sampler.stop()
+    server.stop()
+
+    with open("bench_result.json", "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        ext, weight = part.split("=")
+        mix["." + ext.strip().lstrip(".")] = float(weight)
+    return mix
+
+
+def print_table(all_results: List[dict]):
+    header = (f"{'files':>7} {'ingest s':>9} {'files/s':>8} {'chunks/s':>9} {'incr s':>7} "
+              f"{'burst s':>8} {'runs':>5} {'ret p50':>8} {'ret p95':>8} {'ans p95':>8} {'rss MB':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in all_results:
+        print(f"{r['size']:>7} {r['initial']['seconds']:>9.2f} {r['initial']['files_per_s']:>8.1f} "
+              f"{r['initial']['chunks_per_s']:>9.1f} {r['incremental']['seconds']:>7.2f} "
+              f"{r['webhook_burst']['seconds']:>8.2f} {r['webhook_burst']['runs']:>5} "
+              f"{r['query']['retrieval']['p50_ms']:>8.1f} {r['query']['retrieval']['p95_ms']:>8.1f} "
+              f"{r['query']['answer']['p95_ms']:>8.1f} {r['peak_rss_mb']:>7.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingest and query benchmarks")
+    parser.add_argument("--sizes", default="100,500,2000", help="comma-separated corpus sizes (files)")
+    parser.add_argument("--mix", default="txt=0.7,csv=0.25,mp3=0.05", help="file type weights")
+    parser.add_argument("--file-kb", type=int, default=8, help="approximate size of each text/csv file")
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--change-fraction", type=float, default=0.05, help="share of files edited between syncs")
+    parser.add_argument("--burst", type=int, default=50, help="notifications in the webhook burst")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--graph-latency-ms", type=float, default=0.0, help="delay added to every fake Graph response")
+    parser.add_argument("--output", help="write all results as JSON here")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(json.loads(args.worker))
+
+    env = {
+        **os.environ,
+        "EMBEDDING_BACKEND": "fake",
+        "LLM_PROVIDER": "fake",
+        "TRANSCRIBE_BACKEND": "stub",
+        "INTENT_BACKEND": "local",
+        "SYNC_MODE": "delta",
+        "INGEST_MODE": "in_place",
+        "REBUILD_INDEX": "0",
+        "METRICS_LOG_PATH": "",
+        "PROFILE_RUNS": "0",
+        # Workers run from a scratch directory; the parse pool's forkserver only
+        # finds create_vectordb (to preload it) through PYTHONPATH.
+        "PYTHONPATH": os.pathsep.join([REPO_DIR] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])),
+    }
+    all_results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        config = {
+            "size": size, "mix": parse_mix(args.mix), "file_kb": args.file_kb, "folders": args.folders,
+            "change_fraction": args.change_fraction, "burst": args.burst, "queries": args.queries,
+            "graph_latency_ms": args.graph_latency_ms,
+        }
+        workdir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+        print(f"[⏱️ Benchmark] {size} files in {workdir}", flush=True)
+        try:
+            with open(os.path.join(workdir, "bench.log"), "w") as log:
+                subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+            with open(os.path.join(workdir, "bench_result.json"), "r") as f:
+                all_results.append(json.load(f))
+        except subprocess.CalledProcessError:
+            print(f"[❌ Benchmark failed] See {os.path.join(workdir, 'bench.log')}")
+            args.keep = True
+            break
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if all_results:
+        print_table(all_results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
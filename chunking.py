@@ -0,0 +1,167 @@
+import os, csv
+from typing import Iterable, List, Tuple
+from dotenv import load_dotenv
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+load_dotenv()
+
+# Chunking strategy per layout. Loaders tag documents with metadata["chunking"];
+# anything untagged (docx, txt, transcripts, legacy .xls) uses "default".
+#   tabular  one document per sheet, first line is the header, one row per line;
+#            chunks are row groups that each repeat the header
+#   slides   one document per slide; a slide is one chunk unless it is too long
+#   pdf      one document per page; consecutive pages are packed together while
+#            they fit, long pages are split, chunks never mix unrelated text
+#   media    timestamped transcript windows from transcription.py, already
+#            grouped to CHUNK_SIZE_MEDIA; kept whole
+# Sizes are characters; tabular overlap is counted in rows.
+LAYOUT_DEFAULTS = {
+    "default": (1000, 200),
+    "pdf": (1500, 150),
+    "slides": (1500, 100),
+    "tabular": (2000, 0),
+    "media": (1500, 0),
+}
+
+
+def chunk_settings(layout: str) -> Tuple[int, int]:
+    size, overlap = LAYOUT_DEFAULTS.get(layout, LAYOUT_DEFAULTS["default"])
+    key = layout.upper()
+    return (int(os.getenv(f"CHUNK_SIZE_{key}", str(size))),
+            int(os.getenv(f"CHUNK_OVERLAP_{key}", str(overlap))))
+
+
+def _splitter(layout: str) -> RecursiveCharacterTextSplitter:
+    size, overlap = chunk_settings(layout)
+    return RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=min(overlap, size // 2))
+
+
+def _cell(value) -> str:
+    return "" if value is None else str(value).replace("\r", " ").replace("\n", " ").strip()
+
+
+def _table_document(rows: Iterable[list], metadata: dict) -> List[Document]:
+    lines = []
+    for row in rows:
+        cells = [_cell(value) for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            lines.append(" | ".join(cells))
+    if not lines:
+        return []
+    return [Document(page_content="\n".join(lines), metadata={**metadata, "chunking": "tabular"})]
+
+
+def load_csv(path: str) -> List[Document]:
+    with open(path, "r", newline="", encoding="utf-8-sig", errors="replace") as f:
+        return _table_document(csv.reader(f), {})
+
+
+def load_xlsx(path: str) -> List[Document]:
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        docs = []
+        for sheet in workbook.worksheets:
+            docs.extend(_table_document(sheet.iter_rows(values_only=True), {"sheet": sheet.title}))
+        return docs
+    finally:
+        workbook.close()
+
+
+def load_pptx(path: str) -> List[Document]:
+    from pptx import Presentation
+    docs = []
+    for number, slide in enumerate(Presentation(path).slides, start=1):
+        parts = []
+        for shape in slide.shapes:
+            if shape.has_text_frame and shape.text_frame.text.strip():
+                parts.append(shape.text_frame.text.strip())
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    parts.append(" | ".join(_cell(cell.text) for cell in row.cells))
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text.strip():
+            parts.append("Notes: " + slide.notes_slide.notes_text_frame.text.strip())
+        if parts:
+            docs.append(Document(page_content="\n".join(parts), metadata={"slide": number, "chunking": "slides"}))
+    return docs
+
+
+def chunk_tabular(doc: Document) -> List[Document]:
+    size, overlap_rows = chunk_settings("tabular")
+    header, *rows = doc.page_content.split("\n")
+    chunks = []
+    start = 0
+    while start < len(rows):
+        end, length = start, len(header)
+        # Always take at least one row, then add rows while they fit.
+        while end < len(rows) and (end == start or length + len(rows[end]) + 1 <= size):
+            length += len(rows[end]) + 1
+            end += 1
+        chunks.append(Document(
+            page_content="\n".join([header] + rows[start:end]),
+            metadata={**doc.metadata, "row_start": start + 1, "row_end": end},
+        ))
+        if end >= len(rows):
+            break
+        start = max(end - overlap_rows, start + 1)
+    if not rows:
+        chunks.append(Document(page_content=header, metadata=dict(doc.metadata)))
+    return chunks
+
+
+def chunk_whole(doc: Document, layout: str) -> List[Document]:
+    size, _ = chunk_settings(layout)
+    if len(doc.page_content) <= size:
+        return [doc]
+    return _splitter(layout).split_documents([doc])
+
+
+def chunk_pdf_pages(pages: List[Document]) -> List[Document]:
+    size, _ = chunk_settings("pdf")
+    splitter = _splitter("pdf")
+    chunks, group = [], []
+
+    def flush():
+        if group:
+            text = "\n\n".join(page.page_content for page in group)
+            metadata = {**group[0].metadata, "page_end": group[-1].metadata.get("page")}
+            chunks.append(Document(page_content=text, metadata=metadata))
+            group.clear()
+
+    for page in pages:
+        if not page.page_content.strip():
+            continue
+        if len(page.page_content) > size:
+            flush()
+            for chunk in splitter.split_documents([page]):
+                chunk.metadata["page_end"] = page.metadata.get("page")
+                chunks.append(chunk)
+            continue
+        if group and sum(len(p.page_content) + 2 for p in group) + len(page.page_content) > size:
+            flush()
+        group.append(page)
+    flush()
+    return chunks
+
+
+def chunk_documents(docs: List[Document]) -> List[Document]:
+    by_layout = {}
+    for doc in docs:
+        by_layout.setdefault(doc.metadata.get("chunking", "default"), []).append(doc)
+
+    chunks = []
+    for layout, layout_docs in by_layout.items():
+        if layout == "tabular":
+            for doc in layout_docs:
+                chunks.extend(chunk_tabular(doc))
+        elif layout in ("slides", "media"):
+            for doc in layout_docs:
+                chunks.extend(chunk_whole(doc, layout))
+        elif layout == "pdf":
+            chunks.extend(chunk_pdf_pages(layout_docs))
+        else:
+            chunks.extend(_splitter(layout).split_documents(layout_docs))
+    return [chunk for chunk in chunks if chunk.page_content]  # ❗️Filter out empty or None page_content
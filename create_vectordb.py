@@ -1,114 +1,273 @@
 ### MORE ACCURATE CHUNKS EXTRACTION , NO UUID SCENE FOR EACH CHUNK ###
 
-import os, requests, shutil, tempfile, json, uuid
-from io import BytesIO
-from typing import Generator, Tuple, List
+import os, re, sys, requests, shutil, json, hashlib, itertools, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from typing import Generator, Tuple, List, Optional
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
-from openai import OpenAI
+from graph_client import get_graph
+from spool import Spool
+from chunking import chunk_documents, load_csv, load_pptx, load_xlsx
+from transcription import transcribe_media
+from parse_pool import parse_in_pool
+from embedding_cache import get_embedding_model
+from embedding_scheduler import EmbeddingScheduler
+from sync_manifest import SyncManifest
+from metrics import incr, log_event, observe, profiled, span
+from retrieval import BM25Index, bm25_path
+from index_state import (
+    bump_index_version, check_index_health, read_index_version, active_collection,
+    generation_collection, copy_collection, gc_generations, collection_names,
+)
 
 load_dotenv()
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-SHAREPOINT_SITE = os.getenv("SITE_URL_NEW")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PROCESSED_META_FILE = "processed_files.json"
-
-def get_access_token():
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default"
+SYNC_MODE = os.getenv("SYNC_MODE", "delta")  # "delta" or "full"
+INGEST_MODE = os.getenv("INGEST_MODE", "in_place")  # "in_place" or "blue_green"
+REBUILD_INDEX = os.getenv("REBUILD_INDEX", "0") == "1"
+KEEP_GENERATIONS = int(os.getenv("KEEP_GENERATIONS", "2"))
+CHROMA_PATH = "chroma_db"
+MAX_DOWNLOAD_WORKERS = int(os.getenv("MAX_DOWNLOAD_WORKERS", "8"))
+EMBED_FLUSH_CHUNKS = int(os.getenv("EMBED_FLUSH_CHUNKS", "5000"))
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", "500"))
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".pptx", ".xls", ".xlsx", ".csv", ".txt", ".mp3", ".mp4"}
+
+graph = get_graph()
+
+def get_item(drive_id: str, file_id: str) -> Optional[dict]:
+    res = graph.get(f"drives/{drive_id}/items/{file_id}")
+    if res.status_code == 404:
+        return None
+    res.raise_for_status()
+    return res.json()
+
+def download_file(drive_id: str, item: dict, spool: Spool) -> Tuple[dict, Optional[str], Optional[str], Optional[str]]:
+    # Returns (item, spool_path, content_hash, error). A failed download is
+    # reported rather than raised so one bad file does not abort the run.
+    file_id = item["id"]
+    path = spool.path_for(file_id, item["name"])
+
+    # Stream the body straight to the spool so memory stays flat for large files.
+    spool.reserve(path, item.get("size", 0))
+    try:
+        with span("download") as fields, \
+                graph.get(f"drives/{drive_id}/items/{file_id}/content", stream=True) as content_res:
+            content_res.raise_for_status()
+            content_hash = spool.write_stream(path, content_res)
+            fields["bytes"] = os.path.getsize(path)
+    except Exception as e:
+        spool.release(path)
+        incr("files_total", status="download_failed")
+        return item, None, None, f"download failed: {type(e).__name__}: {e}"
+    incr("files_downloaded_total")
+    incr("bytes_downloaded_total", fields["bytes"])
+    return item, path, content_hash, None
+
+def download_files(drive_id: str, items, spool: Spool) -> Generator[tuple, None, None]:
+    # Keeps at most MAX_DOWNLOAD_WORKERS downloads in flight and yields each file
+    # as soon as it lands, so parsing starts while the crawl is still running.
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(download_file, drive_id, item, spool))
+            if len(pending) >= MAX_DOWNLOAD_WORKERS:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in wait(pending).done:
+            yield future.result()
+
+def list_children(drive_id: str, folder_id: str) -> List[dict]:
+    url = f"drives/{drive_id}/items/{folder_id}/children"
+    return [item for page in graph.iter_pages(url) for item in page.get("value", [])]
+
+def fetch_files(drive_id: str) -> Generator[dict, None, None]:
+    # Lists folders concurrently and yields file items as their folder completes.
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as pool:
+        pending = {pool.submit(list_children, drive_id, "root")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for item in future.result():
+                    if item.get("folder"):
+                        pending.add(pool.submit(list_children, drive_id, item["id"]))
+                    elif item.get("file"):
+                        yield item
+
+def fetch_delta_changes(drive_id: str, delta_link: Optional[str] = None):
+    # Returns (changed_items, deleted_ids, new_delta_link, full_enumeration,
+    # folder_paths). Without a delta link (first run, or the stored one expired)
+    # Graph lists the whole drive, so deletions have to be inferred from what
+    # was NOT returned. Changed items come back with item["path"] set (see
+    # with_item_paths); folder_paths maps the folders in the delta to their
+    # current path, which sync_items compares with the stored ones.
+    full_enumeration = delta_link is None
+    url = delta_link or f"drives/{drive_id}/root/delta"
+    changed, deleted, folders = {}, set(), {}
+    new_delta_link = None
+
+    try:
+        for page in graph.iter_pages(url):
+            # The same item can appear on several pages; the last occurrence wins.
+            for item in page.get("value", []):
+                if item.get("deleted"):
+                    changed.pop(item["id"], None)
+                    folders.pop(item["id"], None)
+                    deleted.add(item["id"])
+                elif item.get("file"):
+                    deleted.discard(item["id"])
+                    changed[item["id"]] = item
+                elif "folder" in item or "root" in item:
+                    folders[item["id"]] = item
+            new_delta_link = page.get("@odata.deltaLink", new_delta_link)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 410 or full_enumeration:
+            raise
+        print("[⚠️ Delta Token Expired] Falling back to full enumeration")
+        return fetch_delta_changes(drive_id)
+
+    folder_paths = delta_folder_paths(folders)
+    changed_items = list(with_item_paths(drive_id, changed.values(), folder_paths))
+    return changed_items, deleted, new_delta_link, full_enumeration, folder_paths
+
+def drive_relative_path(parent_path: Optional[str]) -> Optional[str]:
+    # "/drive/root:/HR/Policies" -> "HR/Policies"; "/drive/root:" -> "".
+    if parent_path is None:
+        return None
+    return parent_path.split("root:", 1)[-1].strip("/")
+
+def folder_path(folder_item: Optional[dict]) -> str:
+    if not folder_item or "root" in folder_item:
+        return ""
+    parent = drive_relative_path((folder_item.get("parentReference") or {}).get("path"))
+    return f"{parent}/{folder_item['name']}" if parent else folder_item["name"]
+
+def delta_folder_paths(folders: dict) -> dict:
+    # Delta items carry no parentReference.path, but the delta pages list the
+    # folders themselves (all of them on a full enumeration, the changed
+    # items' ancestors otherwise), so {folder id: path} can be built from
+    # parent ids alone. Folders whose ancestry is not all there are left out.
+    paths = {}
+
+    def resolve(folder_id: Optional[str], depth: int = 0) -> Optional[str]:
+        if folder_id in paths:
+            return paths[folder_id]
+        folder = folders.get(folder_id)
+        if folder is None or depth > 100:
+            return None
+        if "root" in folder:
+            path = ""
+        else:
+            parent = folder.get("parentReference") or {}
+            parent_path = resolve(parent.get("id"), depth + 1)
+            if parent_path is None:
+                parent_path = drive_relative_path(parent.get("path"))
+            if parent_path is None:
+                return None
+            path = f"{parent_path}/{folder['name']}" if parent_path else folder["name"]
+        paths[folder_id] = path
+        return path
+
+    for folder_id in folders:
+        resolve(folder_id)
+    return paths
+
+def lookup_folder_path(drive_id: str, folder_id: str) -> Optional[str]:
+    folder = get_item(drive_id, folder_id)
+    if folder is None:
+        print(f"[⚠️ Folder Path] Parent folder {folder_id} not found; its files keep their previous path")
+        return None
+    if "root" not in folder and drive_relative_path((folder.get("parentReference") or {}).get("path")) is None:
+        print(f"[⚠️ Folder Path] Graph returned no path for folder {folder.get('name', folder_id)}")
+        return None
+    return folder_path(folder)
+
+def with_item_paths(drive_id: str, items, folder_paths: Optional[dict] = None) -> Generator[dict, None, None]:
+    # Sets item["path"] (drive-relative, e.g. "HR/Policies/handbook.pdf").
+    # Children listings carry the parent's path; delta items do not, so their
+    # folders come from `folder_paths` (see delta_folder_paths) and only
+    # folders missing from it are looked up, once each. A folder that cannot be
+    # resolved leaves path None, which the manifest treats as "unchanged".
+    # Items that already have a path are passed through.
+    folder_paths = dict(folder_paths or {})
+    for item in items:
+        if "path" in item:
+            yield item
+            continue
+        parent = item.get("parentReference") or {}
+        folder = drive_relative_path(parent.get("path"))
+        if folder is None and parent.get("id"):
+            if parent["id"] not in folder_paths:
+                folder_paths[parent["id"]] = lookup_folder_path(drive_id, parent["id"])
+            folder = folder_paths[parent["id"]]
+            if folder is None:
+                item["path"] = None
+                yield item
+                continue
+        item["path"] = f"{folder}/{item['name']}" if folder else item["name"]
+        yield item
+
+def item_metadata(item: dict) -> dict:
+    # Scoping attributes stored on every chunk of the file; retrieval.build_where
+    # turns query filters into Chroma `where` clauses over them.
+    path = item.get("path") or item["name"]
+    folder = path.rsplit("/", 1)[0] if "/" in path else ""
+    metadata = {
+        "path": path,
+        "folder": folder,
+        "top_folder": folder.split("/", 1)[0],
+        "file_type": os.path.splitext(item["name"])[1].lower().lstrip("."),
     }
-    r = requests.post(url, data=data)
-    r.raise_for_status()
-    return r.json()["access_token"]
-
-def fetch_files(token: str) -> Generator[Tuple[str, BytesIO, str, str, str], None, None]:
-    headers = {"Authorization": f"Bearer {token}"}
-    site_name = SHAREPOINT_SITE.split("/")[-1]
-
-    site_res = requests.get(f"https://graph.microsoft.com/v1.0/sites/root:/sites/{site_name}", headers=headers)
-    site_res.raise_for_status()
-    site_id = site_res.json()["id"]
-
-    drive_res = requests.get(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive", headers=headers)
-    drive_res.raise_for_status()
-    drive_id = drive_res.json()["id"]
-
-    def traverse_items(folder_id="root"):
-        url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}/children"
-        res = requests.get(url, headers=headers)
-        res.raise_for_status()
-        for item in res.json().get("value", []):
-            if item.get("folder"):
-                yield from traverse_items(item["id"])
-            elif item.get("file"):
-                file_name = item["name"]
-                file_id = item["id"]
-                last_modified = item.get("lastModifiedDateTime")
-                web_url = item.get("webUrl", f"https://sharepoint.com/{file_name}")
-                content_res = requests.get(
-                    f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{file_id}/content", headers=headers)
-                content_res.raise_for_status()
-                yield file_name, BytesIO(content_res.content), web_url, file_id, last_modified
-
-    yield from traverse_items()
-
-def save_temp_file(file_stream, suffix):
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp.write(file_stream.read())
-    tmp.flush()
-    return tmp.name
-
-def load_document(file_name, file_stream, url: str, file_id: str) -> List[Document]:
+    modified = item.get("lastModifiedDateTime")
+    if modified:
+        try:
+            # Graph returns e.g. "2024-05-01T09:30:00Z" or "...:00.123Z".
+            stamp = datetime.strptime(modified[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+            metadata["last_modified_ts"] = int(stamp.timestamp())
+        except ValueError:
+            pass
+    return metadata
+
+def load_document(file_name, path: str, url: str, file_id: str, content_hash: Optional[str] = None,
+                  extra_metadata: Optional[dict] = None) -> List[Document]:
     ext = os.path.splitext(file_name)[1].lower()
     print(f"[📂 Loading] File: {file_name}, Extension: {ext}")
 
     from langchain_community.document_loaders import (
-        PyPDFLoader, UnstructuredExcelLoader,
-        UnstructuredWordDocumentLoader, UnstructuredPowerPointLoader,
-        CSVLoader, TextLoader
+        PyPDFLoader, UnstructuredExcelLoader, UnstructuredWordDocumentLoader, TextLoader
     )
 
     try:
+        # Loaders keep each format's structure (pages, slides, sheet rows) so
+        # chunk_documents can cut along it; see chunking.py.
         if ext == ".pdf":
-            path = save_temp_file(file_stream, ".pdf")
             docs = PyPDFLoader(path).load()
+            for d in docs:
+                d.metadata["chunking"] = "pdf"
         elif ext == ".docx":
-            path = save_temp_file(file_stream, ".docx")
             docs = UnstructuredWordDocumentLoader(path).load()
         elif ext == ".pptx":
-            path = save_temp_file(file_stream, ".pptx")
-            docs = UnstructuredPowerPointLoader(path).load()
-        elif ext in [".xls", ".xlsx"]:
-            path = save_temp_file(file_stream, ".xlsx")
-            docs = UnstructuredExcelLoader(path).load()
+            docs = load_pptx(path)
+        elif ext == ".xlsx":
+            docs = load_xlsx(path)
+        elif ext == ".xls":
+            docs = UnstructuredExcelLoader(path).load()  # openpyxl cannot read .xls
         elif ext == ".csv":
-            path = save_temp_file(file_stream, ".csv")
-            docs = CSVLoader(path).load()
+            docs = load_csv(path)
         elif ext == ".txt":
-            path = save_temp_file(file_stream, ".txt")
             docs = TextLoader(path).load()
         elif ext in [".mp3", ".mp4"]:
-            temp_path = save_temp_file(file_stream, ext)
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            with open(temp_path, "rb") as f:
-                transcription = client.audio.transcriptions.create(model="whisper-1", file=f)
-            docs = [Document(page_content=transcription.text)]
+            # Segmented, parallel and cached by content hash; see transcription.py.
+            docs = transcribe_media(path, content_hash)
         else:
             print(f"[ℹ️ Unsupported file type] Skipping: {file_name}")
             return []
 
-        # Attach metadata
+        # Attach metadata; extra_metadata carries the scoping attributes from item_metadata().
         for d in docs:
+            d.metadata.update(extra_metadata or {})
             d.metadata["source"] = url
             d.metadata["file_id"] = file_id
 
@@ -119,105 +278,649 @@ def load_document(file_name, file_stream, url: str, file_id: str) -> List[Docume
         print(f"[❌ ERROR loading {file_name}]: {e}")
         return []
 
-def load_processed_metadata():
-    if os.path.exists(PROCESSED_META_FILE):
-        with open(PROCESSED_META_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_processed_metadata(metadata):
-    with open(PROCESSED_META_FILE, "w") as f:
-        json.dump(metadata, f, indent=2)
-
-def chunk_documents(docs):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
-    return [chunk for chunk in chunks if chunk.page_content]  # ❗️Filter out empty or None page_content
-
-def embed_and_store(chunks):
-    persist_path = "chroma_db"
+def get_vectorstore(collection_name: Optional[str] = None, collection_metadata: Optional[dict] = None):
     print("[💡 Initializing Embedding Model]")
-    embedding_model = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-
-    print("[📂 Loading or Creating Chroma Vector Store]")
-    vectorstore = Chroma(persist_directory=persist_path, embedding_function=embedding_model)
-
-    total_deleted = 0
-    file_ids_to_update = {chunk.metadata.get("file_id") for chunk in chunks if "file_id" in chunk.metadata}
-
-    for file_id in file_ids_to_update:
-        print(f"[🧹 Cleaning] Old chunks for file_id: {file_id}")
-        result = vectorstore._collection.get(where={"file_id": file_id})
-        ids_to_delete = result["ids"] if result and "ids" in result else []
-
-        if ids_to_delete:
-            vectorstore.delete(ids=ids_to_delete)
-            print(f"[🗑️ Deleted] {len(ids_to_delete)} chunks for file_id: {file_id}")
-            total_deleted += len(ids_to_delete)
-        else:
-            print(f"[ℹ️ No old chunks found for file_id: {file_id}]")
+    embedding_model = get_embedding_model()
+
+    collection_name = collection_name or active_collection(read_index_version())
+    print(f"[📂 Loading or Creating Chroma Vector Store] Collection: {collection_name}")
+    return Chroma(
+        collection_name=collection_name,
+        persist_directory=CHROMA_PATH,
+        embedding_function=embedding_model,
+        collection_metadata=collection_metadata,
+    )
 
+def lazy_vectorstore(factory):
+    # Defers opening (or, for blue/green, cloning) the target collection until
+    # the first write, so a run with nothing to do costs nothing.
+    opened = []
+    def get():
+        if not opened:
+            opened.append(factory())
+        return opened[0]
+    get.opened = lambda: bool(opened)
+    return get
+
+_bm25_indexes = {}
+
+def get_bm25(vectorstore) -> BM25Index:
+    # The lexical index lives beside its Chroma collection, one file per
+    # collection name, so blue/green generations each get their own.
+    name = vectorstore._collection.name
+    if name not in _bm25_indexes:
+        _bm25_indexes[name] = BM25Index(bm25_path(name))
+    return _bm25_indexes[name]
+
+def ensure_bm25_index(vectorstore):
+    # Backfills the lexical index for collections built before it existed (or
+    # whose index file was lost) from the documents already stored in Chroma.
+    bm25 = get_bm25(vectorstore)
+    total = vectorstore._collection.count()
+    if bm25.count() == total:
+        return bm25
+    print(f"[🔤 BM25 Backfill] Indexing {total} chunk(s) from {vectorstore._collection.name}")
+    bm25.clear()
+    for offset in range(0, total, CHROMA_BATCH_SIZE):
+        page = vectorstore._collection.get(include=["documents"], limit=CHROMA_BATCH_SIZE, offset=offset)
+        # Every chunk gets a row, empty text included, so the counts compared
+        # above agree once the backfill is done.
+        bm25.add(page["ids"], [text or "" for text in page["documents"]])
+    return bm25
+
+def batched(items, size: int):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def chunk_id(file_id: str, position: int, text: str) -> str:
+    return f"{file_id}:{position}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+def assign_chunk_ids(chunks) -> List[str]:
+    # IDs depend only on the file, the chunk's position in it and its content,
+    # so re-indexing an unchanged file reproduces exactly the same IDs.
+    positions = {}
+    ids = []
     for chunk in chunks:
-        chunk.metadata["uuid"] = str(uuid.uuid4())
-
-    print(f"[➕ Adding Chunks] Total: {len(chunks)}")
-    vectorstore.add_documents(chunks)
-    print("[✅ Vector Store Updated]")
-
-def main():
-    token = get_access_token()
-    print("[🔑 Access Token Retrieved]")
-
-    all_chunks = []
-    previous_metadata = load_processed_metadata()
-    current_metadata = {}
-
-    for file_name, file_stream, file_url, file_id, last_modified in fetch_files(token):
-        current_metadata[file_id] = last_modified
-        if previous_metadata.get(file_id) == last_modified:
-            print(f"[⏩ Skipping Unchanged] {file_name}")
+        file_id = chunk.metadata.get("file_id")
+        position = positions.get(file_id, 0)
+        positions[file_id] = position + 1
+        chunk.metadata["chunk_id"] = chunk_id(file_id, position, chunk.page_content)
+        ids.append(chunk.metadata["chunk_id"])
+    return ids
+
+def get_chunk_ids_for_files(vectorstore, file_ids) -> set:
+    existing = set()
+    for file_id_batch in batched(file_ids, CHROMA_BATCH_SIZE):
+        result = vectorstore._collection.get(where={"file_id": {"$in": file_id_batch}}, include=[])
+        existing.update(result["ids"] if result and "ids" in result else [])
+    return existing
+
+def write_batch(vectorstore, ids: List[str], chunks: List[Document], vectors: List[List[float]]):
+    # Embeddings come from the scheduler, so write straight to the collection
+    # instead of add_documents (which would embed the texts again).
+    with span("chroma_write", op="upsert") as fields:
+        fields["chunks"] = len(ids)
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            metadatas=[chunk.metadata for chunk in chunks],
+            documents=[chunk.page_content for chunk in chunks],
+        )
+    incr("chunks_written_total", len(ids))
+
+def refresh_metadata(vectorstore, ids: List[str], chunks: List[Document]) -> int:
+    # Unchanged chunks of a re-indexed file keep their embedding but take the
+    # file's current metadata (new path after a move, new modification time).
+    # Only chunks whose stored metadata differs are written; returns how many.
+    updated = 0
+    for batch in batched(list(zip(ids, chunks)), CHROMA_BATCH_SIZE):
+        stored = vectorstore._collection.get(ids=[id_ for id_, _ in batch], include=["metadatas"])
+        stored = dict(zip(stored["ids"], stored["metadatas"]))
+        stale = [(id_, chunk) for id_, chunk in batch
+                 if any((stored.get(id_) or {}).get(key) != value for key, value in chunk.metadata.items())]
+        if not stale:
             continue
-
-        print(f"\n[📥 New/Updated File] {file_name}")
-        docs = load_document(file_name, file_stream, file_url, file_id)
-        if not docs:
+        with span("chroma_write", op="update") as fields:
+            fields["chunks"] = len(stale)
+            vectorstore._collection.update(ids=[id_ for id_, _ in stale],
+                                           metadatas=[chunk.metadata for _, chunk in stale])
+        updated += len(stale)
+    return updated
+
+def retag_files(collection, metadata_by_file: dict) -> int:
+    # Merges {file id: metadata} into every stored chunk of those files, in
+    # place: nothing is downloaded or re-embedded. Returns the chunks updated.
+    updated = 0
+    for file_ids in batched(metadata_by_file, 100):
+        existing = collection.get(where={"file_id": {"$in": file_ids}}, include=["metadatas"])
+        for batch in batched(list(zip(existing["ids"], existing["metadatas"])), CHROMA_BATCH_SIZE):
+            with span("chroma_write", op="update") as fields:
+                fields["chunks"] = len(batch)
+                collection.update(ids=[id_ for id_, _ in batch], metadatas=[
+                    {**(metadata or {}), **metadata_by_file[(metadata or {}).get("file_id")]} for _, metadata in batch
+                ])
+            updated += len(batch)
+    return updated
+
+def delete_chunks(vectorstore, ids: List[str]):
+    for batch in batched(ids, CHROMA_BATCH_SIZE):
+        with span("chroma_write", op="delete") as fields:
+            fields["chunks"] = len(batch)
+            vectorstore.delete(ids=batch)
+    incr("chunks_deleted_total", len(ids))
+
+def embed_and_store(chunks, vectorstore=None, scheduler=None, file_ids=()) -> int:
+    # Makes the stored chunks of every file in `chunks` (and of `file_ids`,
+    # which may have no chunks left) match `chunks`. Returns how many chunks
+    # were actually written: added, given new metadata, or removed. Zero
+    # means the collection is unchanged.
+    vectorstore = vectorstore or get_vectorstore()
+    scheduler = scheduler or EmbeddingScheduler(vectorstore.embeddings)
+    bm25 = get_bm25(vectorstore)
+
+    ids = assign_chunk_ids(chunks)
+    file_ids = set(file_ids) | {chunk.metadata["file_id"] for chunk in chunks if "file_id" in chunk.metadata}
+    existing_ids = get_chunk_ids_for_files(vectorstore, file_ids)
+    new_ids = set(ids)
+
+    to_add = [(id_, chunk) for id_, chunk in zip(ids, chunks) if id_ not in existing_ids]
+    kept = [(id_, chunk) for id_, chunk in zip(ids, chunks) if id_ in existing_ids]
+    to_delete = sorted(existing_ids - new_ids)
+    print(f"[🔀 Diff] Files: {len(file_ids)}, Unchanged: {len(new_ids & existing_ids)}, "
+          f"Adding: {len(to_add)}, Removing: {len(to_delete)}")
+
+    # Add before deleting: an interrupted run leaves extra chunks behind (which
+    # the next run removes) rather than a file with no chunks at all.
+    if to_add:
+        cache = vectorstore.embeddings
+        hits_before, tokens_before = cache.hits, scheduler.tokens
+        # Includes the Chroma upserts, which run as each batch comes back.
+        with span("embed") as fields:
+            batch_count = scheduler.run(
+                [id_ for id_, _ in to_add],
+                [chunk for _, chunk in to_add],
+                lambda ids, batch, vectors: write_batch(vectorstore, ids, batch, vectors),
+            )
+            fields.update(chunks=len(to_add), batches=batch_count, tokens=scheduler.tokens - tokens_before,
+                          cache_hits=cache.hits - hits_before)
+        incr("cache_hits_total", fields["cache_hits"], cache="embedding")
+        incr("cache_misses_total", len(to_add) - fields["cache_hits"], cache="embedding")
+        with span("bm25_write"):
+            bm25.add([id_ for id_, _ in to_add], [chunk.page_content for _, chunk in to_add])
+        print(f"[🧠 Embedded] Batches: {batch_count}, Tokens: {fields['tokens']}, "
+              f"Cache hits: {fields['cache_hits']}/{len(to_add)}, Concurrency: {scheduler.limiter.limit}")
+
+    refreshed = refresh_metadata(vectorstore, [id_ for id_, _ in kept], [chunk for _, chunk in kept]) if kept else 0
+    delete_chunks(vectorstore, to_delete)
+    bm25.delete(to_delete)
+    print(f"[✅ Vector Store Updated] Added: {len(to_add)}, Metadata refreshed: {refreshed}, Removed: {len(to_delete)}")
+    return len(to_add) + refreshed + len(to_delete)
+
+def select_stale_items(items, manifest: SyncManifest, seen_ids: set, rebuild: bool = False,
+                       retired: Optional[List[str]] = None,
+                       moved: Optional[List[dict]] = None) -> Generator[dict, None, None]:
+    # Decides from listing metadata alone, so unchanged files are never downloaded.
+    # Files renamed to an unsupported type while they still have chunks are
+    # appended to `retired` for retired_files() to clear; unchanged files with
+    # chunks under a new path are appended to `moved` for retag_moved_files().
+    for item in items:
+        seen_ids.add(item["id"])
+        if item.get("path") is None:
+            # Its folder could not be resolved (see with_item_paths); keep the last known path.
+            row = manifest.get(item["id"])
+            item["path"] = row["path"] if row is not None else None
+        if not rebuild and manifest.is_current(item):
+            if not manifest.path_changed(item):
+                print(f"[⏩ Skipping Unchanged] {item['name']}")
+            elif moved is not None and manifest.may_have_chunks(item["id"]):
+                print(f"[📁 Moved] {item['name']} → {item['path']}")
+                moved.append(item)
+            else:
+                manifest.set_path(item["id"], item["path"], item.get("webUrl"))
+            continue
+        if os.path.splitext(item["name"])[1].lower() not in SUPPORTED_EXTENSIONS:
+            print(f"[ℹ️ Unsupported file type] Skipping: {item['name']}")
+            if retired is not None and manifest.may_have_chunks(item["id"]):
+                # Stays pending until its old chunks are gone, so a crash retries it.
+                manifest.mark_pending(item)
+                retired.append(item["id"])
+            else:
+                manifest.mark_unsupported(item)
+            continue
+        manifest.mark_pending(item)
+        yield item
+
+def parse_file(file_name, path: str, url: str, file_id: str, content_hash: Optional[str] = None,
+               extra_metadata: Optional[dict] = None) -> Tuple[List[Document], float]:
+    # Runs inside a parse_pool worker process.
+    started = time.monotonic()
+    docs = load_document(file_name, path, url, file_id, content_hash, extra_metadata)
+    chunks = chunk_documents(docs) if docs else []
+    return chunks, time.monotonic() - started
+
+def index_files(files, spool: Spool, manifest: SyncManifest) -> Generator[tuple, None, None]:
+    # Parses downloaded files across processes and yields
+    # (file_id, content_hash, chunks, parse_seconds, status, error) in completion
+    # order, releasing each file's spool space as soon as it is done. Files that
+    # fail to parse or load nothing are yielded with no chunks, so store_chunks
+    # removes what they had indexed before. Failed downloads are recorded in the
+    # manifest here and not yielded.
+    hashes = {}
+
+    def jobs():
+        for item, path, content_hash, error in files:
+            if error:
+                # Left pending, so the next run retries it.
+                print(f"[❌ ERROR downloading {item['name']}]: {error}")
+                manifest.record_result(item["id"], "pending", error=error)
+                continue
+            print(f"\n[📥 New/Updated File] {item['name']}")
+            hashes[item["id"]] = content_hash
+            web_url = item.get("webUrl", f"https://sharepoint.com/{item['name']}")
+            yield item["name"], path, web_url, item["id"], content_hash, item_metadata(item)
+
+    for (file_name, path, _, file_id, _, _), result, error in parse_in_pool(parse_file, jobs(), preload=("create_vectordb",)):
+        spool.release(path)
+        content_hash = hashes.pop(file_id, None)
+        if error:
+            print(f"[❌ ERROR parsing {file_name}]: {error}")
+            incr("files_total", status="failed")
+            yield file_id, content_hash, [], None, "failed", error
+            continue
+        # Parsing happens in worker processes, so its timing is recorded here.
+        chunks, parse_seconds = result
+        extension = os.path.splitext(file_name)[1].lower()
+        observe("stage_seconds", parse_seconds, stage="parse")
+        log_event("span", stage="parse", seconds=round(parse_seconds, 4), status="ok",
+                  file_type=extension, chunks=len(chunks))
+        if not chunks:
             print(f"[⚠️ No Documents Loaded] Skipping {file_name}")
+            incr("files_total", status="empty")
+            yield file_id, content_hash, [], parse_seconds, "empty", None
             continue
-
-        chunks = chunk_documents(docs)
         print(f"[✂️ Chunked] {file_name}: {len(chunks)} chunks")
-        all_chunks.extend(chunks)
-
-    if all_chunks:
-        embed_and_store(all_chunks)
-        print("[✅ Embeddings Stored]")
+        incr("files_total", status="parsed")
+        incr("chunks_total", len(chunks), file_type=extension)
+        yield file_id, content_hash, chunks, parse_seconds, "indexed", None
+
+def retired_files(retired: List[str]) -> Generator[tuple, None, None]:
+    # index_files-shaped results for files select_stale_items retired. Read
+    # lazily: the list is complete once the downloads it feeds are done.
+    for file_id in retired:
+        yield file_id, None, [], None, "unsupported", None
+
+def store_chunks(parsed_files, get_target, manifest: SyncManifest):
+    # Embeds in batches of EMBED_FLUSH_CHUNKS while later files are still parsing,
+    # and records each file's result in the manifest as soon as its batch is
+    # stored. Files without chunks go through the same diff, which deletes
+    # whatever they had indexed before. Returns the number of chunks written
+    # (see embed_and_store): re-parsing a file to the same chunks counts for
+    # nothing. One scheduler per run so its learned concurrency carries
+    # across flushes.
+    scheduler = None
+    pending, pending_files, total, written = [], [], 0, 0
+
+    def flush():
+        nonlocal scheduler, written
+        # Files that end up with no chunks only need the target if they had some before.
+        if pending or any(manifest.may_have_chunks(parsed[0]) for parsed in pending_files):
+            scheduler = scheduler or EmbeddingScheduler(get_target().embeddings)
+            written += embed_and_store(pending, get_target(), scheduler, [parsed[0] for parsed in pending_files])
+        for file_id, content_hash, chunks, parse_seconds, status, error in pending_files:
+            manifest.record_result(file_id, status, content_hash,
+                                   [chunk.metadata["chunk_id"] for chunk in chunks], parse_seconds, error)
+
+    for parsed in parsed_files:
+        pending.extend(parsed[2])
+        pending_files.append(parsed)
+        if len(pending) >= EMBED_FLUSH_CHUNKS:
+            flush()
+            total += len(pending)
+            pending, pending_files = [], []
+    if pending_files:
+        flush()
+        total += len(pending)
+
+    if written:
+        print(f"[✅ Embeddings Stored] {written} chunk(s) added, refreshed or removed ({total} parsed)")
+    elif total:
+        print(f"[📦 Chunks Unchanged] {total} chunk(s) already stored")
     else:
         print("[⚠️ No New Chunks to Store]")
-
-    # Handle deletions
-    deleted_ids = set(previous_metadata.keys()) - set(current_metadata.keys())
-    if deleted_ids:
-        print(f"\n[🗑️ Deleted Files Detected] Count: {len(deleted_ids)}")
-        embedding_model = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        vectorstore = Chroma(persist_directory="chroma_db", embedding_function=embedding_model)
-
-        for file_id in deleted_ids:
-            result = vectorstore._collection.get(where={"file_id": file_id})
-            ids_to_delete = result["ids"] if result and "ids" in result else []
-            if ids_to_delete:
-                vectorstore.delete(ids=ids_to_delete)
-                print(f"[✅ Removed] {len(ids_to_delete)} chunks from file_id: {file_id}")
-            else:
-                print(f"[ℹ️ Nothing to remove] file_id: {file_id}")
-    else:
+    return written
+
+def moved_folder_items(manifest: SyncManifest, folder_paths: dict, listed_ids: set) -> List[dict]:
+    # Files under the folders the delta reports as renamed or moved, which the
+    # delta itself does not list, as items for retag_moved_files(). Built from
+    # their manifest rows with the new path; files without chunks only need
+    # the row updated.
+    items = []
+    for file_id, path in manifest.folder_moves(folder_paths).items():
+        if file_id in listed_ids:
+            continue  # select_stale_items sees these
+        row = manifest.get(file_id)
+        if not manifest.may_have_chunks(file_id):
+            manifest.set_path(file_id, path)
+            continue
+        items.append({"id": file_id, "name": row["name"], "path": path, "lastModifiedDateTime": row["last_modified"]})
+    if items:
+        print(f"[📁 Folder Moved] {len(items)} file(s) under renamed or moved folders")
+    return items
+
+def retag_moved_files(moved: List[dict], get_target, manifest: SyncManifest) -> int:
+    # Moved or renamed files with unchanged content: their chunks take the new
+    # path/folder metadata (and link, when the listing has it) in place.
+    # Returns the chunks updated.
+    if not moved:
+        return 0
+    metadata_by_file = {}
+    for item in moved:
+        metadata_by_file[item["id"]] = item_metadata(item)
+        if item.get("webUrl"):
+            metadata_by_file[item["id"]]["source"] = item["webUrl"]
+    updated = retag_files(get_target()._collection, metadata_by_file)
+    for item in moved:
+        manifest.set_path(item["id"], item["path"], item.get("webUrl"))
+    print(f"[📁 Moved Files] {updated} chunk(s) re-tagged across {len(metadata_by_file)} file(s)")
+    return updated
+
+def remove_deleted_files(deleted_ids, get_target, manifest: SyncManifest):
+    if not deleted_ids:
         print("[✔️ No Deletions Detected]")
+        return 0
+
+    print(f"\n[🗑️ Deleted Files Detected] Count: {len(deleted_ids)}")
+    vectorstore = get_target()
+
+    ids_to_delete = sorted(get_chunk_ids_for_files(vectorstore, deleted_ids))
+    delete_chunks(vectorstore, ids_to_delete)
+    get_bm25(vectorstore).delete(ids_to_delete)
+    manifest.delete(deleted_ids)
+    print(f"[✅ Removed] {len(ids_to_delete)} chunks from {len(deleted_ids)} deleted file(s)")
+    return len(deleted_ids)
+
+# full_sync / delta_sync index into get_target() and record per-file progress in
+# the manifest as they go. They return the new delta link, which main() stores
+# only once the target collection is live.
+
+def full_sync(get_target, manifest: SyncManifest, rebuild: bool = False):
+    drive_id = graph.drive_id()
+    seen_ids = set()
+
+    retired, moved = [], []
+    stale_items = select_stale_items(with_item_paths(drive_id, fetch_files(drive_id)), manifest, seen_ids, rebuild,
+                                     retired, moved)
+    with Spool() as spool:
+        parsed = itertools.chain(index_files(download_files(drive_id, stale_items, spool), spool, manifest),
+                                 retired_files(retired))
+        stored = store_chunks(parsed, get_target, manifest)
+    retagged = retag_moved_files(moved, get_target, manifest)
+    removed = remove_deleted_files(manifest.file_ids() - seen_ids, get_target, manifest)
+    return {"changed": bool(stored or retagged or removed), "delta_link": None}
+
+def delta_sync(get_target, manifest: SyncManifest, rebuild: bool = False):
+    drive_id = graph.drive_id()
+
+    delta_link = None if rebuild else manifest.get_state("delta_link")
+    print("[🔁 Delta Sync] " + ("Resuming from stored delta token" if delta_link else "No delta token, enumerating drive"))
+    with span("list_changes") as fields:
+        changed_items, deleted_ids, new_delta_link, full_enumeration, folder_paths = fetch_delta_changes(
+            drive_id, delta_link)
+        fields.update(changed=len(changed_items), deleted=len(deleted_ids))
+    if full_enumeration:
+        deleted_ids |= manifest.file_ids() - {item["id"] for item in changed_items}
+
+    add_pending_items(drive_id, manifest, changed_items, deleted_ids)
+    print(f"[🔁 Delta Sync] Changed: {len(changed_items)}, Deleted: {len(deleted_ids)}")
+
+    changed = sync_items(drive_id, changed_items, deleted_ids, get_target, manifest, rebuild, folder_paths)
+    return {"changed": changed, "delta_link": new_delta_link}
+
+def add_pending_items(drive_id: str, manifest: SyncManifest, changed_items: List[dict], deleted_ids: set):
+    # Files a previous run listed but never finished (crash, failed download)
+    # are not in this delta any more, so fetch them again explicitly.
+    listed = {item["id"] for item in changed_items}
+    for file_id in manifest.file_ids_with_status("pending") - listed - deleted_ids:
+        item = get_item(drive_id, file_id)
+        if item is None:
+            deleted_ids.add(file_id)
+        elif item.get("file"):
+            changed_items.append(item)
+
+def sync_items(drive_id: str, changed_items: List[dict], deleted_ids: set, get_target,
+               manifest: SyncManifest, rebuild: bool = False, folder_paths: Optional[dict] = None) -> bool:
+    # Re-ingests just these items and removes just these deletions; shared by
+    # delta_sync and the webhook-driven reindex_from_notifications.
+    # `folder_paths` (from fetch_delta_changes) re-paths the files under
+    # renamed or moved folders.
+    retired = []
+    moved = moved_folder_items(manifest, folder_paths or {}, {item["id"] for item in changed_items})
+    stale_items = select_stale_items(with_item_paths(drive_id, changed_items), manifest, set(), rebuild, retired,
+                                     moved)
+    with Spool() as spool:
+        parsed = itertools.chain(index_files(download_files(drive_id, stale_items, spool), spool, manifest),
+                                 retired_files(retired))
+        stored = store_chunks(parsed, get_target, manifest)
+    retagged = retag_moved_files(moved, get_target, manifest)
+
+    removed = remove_deleted_files(manifest.known(deleted_ids), get_target, manifest)
+    if folder_paths:
+        # Last, so a crashed run finds the same folder moves again.
+        manifest.set_folder_paths(folder_paths)
+    return bool(stored or retagged or removed)
+
+def save_sync_state(result, manifest: SyncManifest):
+    # Persist the token only after everything it covers is live, so a crashed
+    # run replays the same changes next time.
+    if result["delta_link"]:
+        manifest.set_state("delta_link", result["delta_link"])
+    manifest.flush()
+    print(f"[🗂️ Manifest] {manifest.status_counts()}")
+
+def open_shadow(live_name: str, shadow_name: str, rebuild: bool):
+    live = get_vectorstore(live_name)
+    client = live._client
+    if shadow_name in collection_names(client):
+        print(f"[🧹 Dropping Stale Shadow] {shadow_name}")
+        client.delete_collection(shadow_name)
+
+    shadow = get_vectorstore(shadow_name, collection_metadata=live._collection.metadata)
+    remove_bm25_index(shadow_name)
+    if not rebuild:
+        copied = copy_collection(live._collection, shadow._collection)
+        _bm25_indexes[shadow_name] = ensure_bm25_index(live).copy_to(bm25_path(shadow_name))
+        print(f"[🪞 Shadow Seeded] {copied} chunks copied from {live_name} into {shadow_name}")
+    return shadow
+
+def remove_bm25_index(collection_name: str):
+    bm25 = _bm25_indexes.pop(collection_name, None)
+    if bm25:
+        bm25.close()
+    for suffix in ("", "-wal", "-shm"):
+        path = bm25_path(collection_name) + suffix
+        if os.path.exists(path):
+            os.remove(path)
+
+def report_health(vectorstore):
+    # The health scan is O(N), so it runs here once per changed index instead
+    # of on every query in the Streamlit app.
+    health = check_index_health(vectorstore._collection)
+    print(f"\n[📦 VectorStore Total Chunks]: {health['total_chunks']}")
+    if health["broken_chunks"]:
+        print(f"[⚠️ Document Health] {health['broken_chunks']} chunk(s) with empty page_content")
+    else:
+        print("[✅ Document Health] All documents have valid content")
+    return health
+
+@profiled("sync")
+@span("sync_run")
+def main(rebuild: bool = REBUILD_INDEX):
+    # Cached by the shared client, so webhook-driven runs reuse one token
+    # (and one site/drive lookup) until it is about to expire.
+    graph.access_token()
+    print("[🔑 Access Token Ready]")
+
+    # blue_green writes into a shadow collection (a copy of the live one, or an
+    # empty one for a rebuild) and promotes it by swapping the collection name
+    # in index_version.json. Readers keep serving the old generation until then.
+    blue_green = rebuild or INGEST_MODE == "blue_green"
+    version = read_index_version()
+    live_name = active_collection(version)
+    target_name = generation_collection(version.get("generation", 0) + 1) if blue_green else live_name
+    if blue_green:
+        print(f"[🔵🟢 Blue/Green] Building {target_name} ({'rebuild' if rebuild else 'incremental'}), live: {live_name}")
+        get_target = lazy_vectorstore(lambda: open_shadow(live_name, target_name, rebuild))
+    else:
+        get_target = lazy_vectorstore(lambda: get_vectorstore(live_name))
 
-    save_processed_metadata(current_metadata)
-
-    # Final summary
-    vectorstore = Chroma(persist_directory="chroma_db", embedding_function=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))
-    print(f"\n[📦 VectorStore Total Chunks]: {vectorstore._collection.count()}")
+    # In blue/green mode the manifest is one transaction committed right after
+    # promotion; a crash before that rolls it back along with the shadow.
+    manifest = SyncManifest(deferred=blue_green)
+    try:
+        sync = full_sync if SYNC_MODE == "full" else delta_sync
+        result = sync(get_target, manifest, rebuild)
+
+        if not result["changed"]:
+            save_sync_state(result, manifest)
+            if get_target.opened() and blue_green:
+                get_target()._client.delete_collection(target_name)
+                remove_bm25_index(target_name)
+            else:
+                ensure_bm25_index(get_vectorstore(live_name))
+            print(f"\n[📦 Index Unchanged] Collection: {live_name}")
+            return
+
+        vectorstore = get_target()
+        ensure_bm25_index(vectorstore)
+        health = report_health(vectorstore)
+
+        # Tell readers (streamlit_app) to pick up the new index. For blue/green
+        # this rename of index_version.json is the atomic promotion.
+        version = bump_index_version(collection=target_name, total_chunks=health["total_chunks"])
+        save_sync_state(result, manifest)
+        print(f"[🔖 Index Version] Generation {version['generation']} → {target_name}")
+    finally:
+        manifest.close()
+
+    if blue_green:
+        removed = gc_generations(vectorstore._client, target_name, KEEP_GENERATIONS)
+        for name in removed:
+            remove_bm25_index(name)
+        if removed:
+            print(f"[🧹 Old Generations Removed] {', '.join(removed)}")
+
+
+def notification_item_ids(notifications: List[dict]) -> Optional[set]:
+    # Item IDs named by the notifications, or None if any of them does not name
+    # one. Subscriptions on a drive root (ours) send no item details, so those
+    # are resolved through the delta link instead.
+    item_ids = set()
+    for notification in notifications:
+        resource_id = (notification.get("resourceData") or {}).get("id")
+        match = re.search(r"/items/([^/?]+)", notification.get("resource") or "")
+        if resource_id:
+            item_ids.add(resource_id)
+        elif match and match.group(1) != "root":
+            item_ids.add(match.group(1))
+        else:
+            return None
+    return item_ids
+
+@profiled("targeted_reindex")
+@span("targeted_reindex")
+def reindex_from_notifications(notifications: List[dict]):
+    # Webhook fast path: resolve only the affected drive items (from the
+    # notification itself, or the stored delta link), re-ingest or delete just
+    # those in place and bump the index version. Anything needing a full
+    # enumeration or a blue/green build goes through main().
+    if INGEST_MODE == "blue_green":
+        return main()
+    started = time.monotonic()
+    drive_id = graph.drive_id()
+    manifest = SyncManifest()
+    try:
+        item_ids = notification_item_ids(notifications)
+        delta_link = None
+        if item_ids:
+            mode = "items"
+            changed_items, deleted_ids, folder_paths = [], set(), None
+            for file_id in item_ids:
+                item = get_item(drive_id, file_id)
+                if item is None:
+                    deleted_ids.add(file_id)
+                elif item.get("file"):
+                    changed_items.append(item)
+        else:
+            mode = "delta"
+            stored_link = manifest.get_state("delta_link")
+            if not stored_link:
+                manifest.close()
+                return main()
+            changed_items, deleted_ids, delta_link, full_enumeration, folder_paths = fetch_delta_changes(
+                drive_id, stored_link)
+            if full_enumeration:
+                # The stored link expired; a full enumeration needs main()'s
+                # deletion inference, so let it do the whole run.
+                manifest.close()
+                return main()
+        add_pending_items(drive_id, manifest, changed_items, deleted_ids)
+        print(f"[🎯 Targeted Reindex] Mode: {mode}, Notifications: {len(notifications)}, "
+              f"Changed: {len(changed_items)}, Deleted: {len(deleted_ids)}")
+
+        live_name = active_collection(read_index_version())
+        get_target = lazy_vectorstore(lambda: get_vectorstore(live_name))
+        changed = sync_items(drive_id, changed_items, deleted_ids, get_target, manifest, folder_paths=folder_paths)
+        if changed:
+            # No O(N) health scan here: only a handful of files were touched.
+            version = bump_index_version(collection=live_name, total_chunks=get_target()._collection.count())
+            print(f"[🔖 Index Version] Generation {version['generation']} → {live_name}")
+
+        manifest.set_state("last_targeted_reindex", json.dumps({
+            "finished_at": time.time(),
+            "seconds": round(time.monotonic() - started, 3),
+            "mode": mode,
+            "notifications": len(notifications),
+            "changed_items": sorted(item["id"] for item in changed_items),
+            "deleted_items": sorted(deleted_ids),
+            "index_changed": changed,
+        }))
+        save_sync_state({"changed": changed, "delta_link": delta_link}, manifest)
+        print(f"[⏱️ Targeted Reindex] Done in {time.monotonic() - started:.2f}s")
+    finally:
+        manifest.close()
+
+def backfill_metadata():
+    # One-off for indexes built before ingest recorded scoping metadata: lists
+    # the drive once and merges item_metadata() into the existing chunks of
+    # every indexed file. Nothing is downloaded or re-embedded.
+    drive_id = graph.drive_id()
+    live_name = active_collection(read_index_version())
+    collection = get_vectorstore(live_name)._collection
+    manifest = SyncManifest()
+    try:
+        indexed = manifest.file_ids_with_status("indexed")
+        metadata_by_file = {}
+        for item in with_item_paths(drive_id, fetch_files(drive_id)):
+            if item["id"] in indexed:
+                metadata_by_file[item["id"]] = item_metadata(item)
+                manifest.set_path(item["id"], item["path"])
+
+        updated = retag_files(collection, metadata_by_file)
+    finally:
+        manifest.close()
+    if updated:
+        version = bump_index_version(collection=live_name, total_chunks=collection.count())
+        print(f"[🔖 Index Version] Generation {version['generation']} → {live_name}")
+    print(f"[🏷️ Metadata Backfill] {updated} chunk(s) from {len(metadata_by_file)} file(s)")
 
 
 if __name__ == "__main__":
-    main()
+    # `python create_vectordb.py --profile` profiles just this run (see metrics.profiled).
+    if "--backfill-metadata" in sys.argv:
+        backfill_metadata()
+    elif "--profile" in sys.argv:
+        with profiled("sync_cli", enabled=True):
+            main()
+    else:
+        main()
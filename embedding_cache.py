@@ -0,0 +1,145 @@
+import os, hashlib, math, re, sqlite3, threading, time
+from array import array
+from typing import List
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # "openai" or "fake"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+FAKE_EMBEDDING_DIM = 256
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite3")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+EMBED_CACHE_LOW_WATER = 0.9  # eviction trims the cache to this fraction of max_entries
+
+
+def text_hash(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    # Content-addressed cache in front of an embedding model. Vectors are stored
+    # in SQLite keyed by sha256(model + chunk text), so unchanged chunks of an
+    # edited file and boilerplate repeated across files never hit the API twice.
+    # When the cache grows past max_entries the least recently used rows go,
+    # down to EMBED_CACHE_LOW_WATER of it.
+
+    def __init__(self, underlying: Embeddings, model: str, path: str = EMBED_CACHE_PATH,
+                 max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            # SQLite caps bound parameters, so look keys up in slices.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, entries: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in entries.items()],
+            )
+            # Replaced keys are counted too, so the running count can only
+            # overshoot; recount before evicting. Evicting down to the low-water
+            # mark keeps the count and the delete off most stores.
+            self._count += len(entries)
+            if self._count > self.max_entries:
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._count > self.max_entries:
+                    overflow = self._count - int(self.max_entries * EMBED_CACHE_LOW_WATER)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+                    )
+                    self._count -= overflow
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_hash(text, self.model) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        # Embed each distinct missing text once, even if it repeats in the batch.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+
+class FakeEmbeddings(Embeddings):
+    # Deterministic offline backend: a hashed bag-of-words vector, so the same
+    # text always maps to the same vector and texts sharing words land close
+    # together. No network, no API key; used for tests and benchmarks.
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def get_embedding_model(cached: bool = True) -> Embeddings:
+    # The query path passes cached=False so the Streamlit process never writes
+    # into the ingest cache.
+    if EMBEDDING_BACKEND == "fake":
+        underlying, model = FakeEmbeddings(), f"fake-{FAKE_EMBEDDING_DIM}"
+    else:
+        underlying, model = OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY), EMBEDDING_MODEL
+    return CachedEmbeddings(underlying, model) if cached else underlying
@@ -0,0 +1,133 @@
+import os, random, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, List
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from metrics import incr, observe
+
+load_dotenv()
+
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "1000"))  # API hard limit is 2048
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def pack_batches(ids: List[str], chunks: List[Document], max_tokens: int = EMBED_BATCH_TOKENS,
+                 max_inputs: int = EMBED_BATCH_MAX_INPUTS) -> List[list]:
+    # Greedily fills each batch up to max_tokens / max_inputs. A single chunk
+    # above the token budget still gets a batch of its own.
+    batches, current, current_tokens = [], [], 0
+    for id_, chunk in zip(ids, chunks):
+        tokens = count_tokens(chunk.page_content)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((id_, chunk, tokens))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency control: every 429 halves the number of batches allowed
+    # in flight, and each run of `limit` consecutive successes adds one back.
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, rate_limited: bool):
+        with self._cond:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class EmbeddingScheduler:
+    # Packs chunks into token-bounded batches, embeds several batches at once and
+    # hands each finished batch to `on_batch` on the calling thread, so the
+    # vector store is written as results arrive and by a single writer.
+
+    def __init__(self, embeddings: Embeddings, max_batch_tokens: int = EMBED_BATCH_TOKENS,
+                 max_batch_inputs: int = EMBED_BATCH_MAX_INPUTS, max_concurrency: int = EMBED_MAX_CONCURRENCY,
+                 max_retries: int = EMBED_MAX_RETRIES):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                limited = is_rate_limited(e)
+                self.limiter.release(limited)
+                if not limited or attempt == self.max_retries:
+                    raise
+                self.rate_limited += 1
+                incr("api_retries_total", api="embeddings")
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                print(f"[⏳ Rate Limited] Concurrency now {self.limiter.limit}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                self.limiter.release(False)
+                observe("embedding_batch_seconds", time.perf_counter() - started)
+                return vectors
+
+    def run(self, ids: List[str], chunks: List[Document],
+            on_batch: Callable[[List[str], List[Document], List[List[float]]], None]) -> int:
+        batches = pack_batches(ids, chunks, self.max_batch_tokens, self.max_batch_inputs)
+        with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency) as pool:
+            futures = {
+                pool.submit(self._embed_batch, [chunk.page_content for _, chunk, _ in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                vectors = future.result()
+                tokens = sum(tokens for _, _, tokens in batch)
+                self.tokens += tokens
+                incr("embedding_tokens_total", tokens)
+                on_batch([id_ for id_, _, _ in batch], [chunk for _, chunk, _ in batch], vectors)
+        return len(batches)
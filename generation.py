@@ -0,0 +1,160 @@
+import os, time
+from functools import lru_cache
+from typing import Iterator, List, Tuple
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from openai import OpenAI
+from metrics import incr, observe, span
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai", "openrouter" or "fake"
+OPENAI_CHAT_MODEL = "gpt-4o-mini-2024-07-18"
+OPENROUTER_CHAT_MODEL = "openai/gpt-4o-mini"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))    # whole prompt: context + history + question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # retrieved chunks, within the above
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+SOURCES_MARKER = "\n\n📎 **Sources:**"
+
+PROMPT_TEMPLATE = """
+Use the following context to answer the user's question.
+
+Context:
+{context}
+
+---
+
+User: {question}
+Assistant:"""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(OPENAI_CHAT_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokens = _encoding().encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else _encoding().decode(tokens[:max_tokens])
+
+
+def fit_context(chunks: List[str], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    # Chunks arrive best first; keep as many as fit, cutting the last one
+    # short rather than dropping it outright.
+    parts, used = [], 0
+    for text in chunks:
+        remaining = budget - used
+        if remaining <= 0:
+            break
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            text, tokens = truncate_tokens(text, remaining), remaining
+        parts.append(text)
+        used += tokens
+    return "\n\n---\n\n".join(parts)
+
+
+def summarize_turns(turns: List[Tuple[str, str]], budget: int = HISTORY_SUMMARY_TOKENS) -> str:
+    # Extractive, so it costs no extra LLM call: the earlier questions are
+    # usually enough for follow-ups like "and for last year?".
+    questions = [msg.strip().replace("\n", " ") for msg, role in reversed(turns) if role == "user"]
+    if not questions:
+        return ""
+    summary = "Earlier in this conversation the user asked (most recent first): " + "; ".join(questions)
+    return truncate_tokens(summary, budget)
+
+
+def build_messages(question: str, chunks: List[str], history: List[Tuple[str, str]],
+                   budget: int = PROMPT_TOKEN_BUDGET) -> List[dict]:
+    # history is [(message, role)] oldest first, without the current question.
+    # The newest turns that fit the budget are sent verbatim; older ones are
+    # folded into a one-line summary, so prompt size stays bounded however
+    # long the session runs.
+    context = fit_context(chunks, min(CONTEXT_TOKEN_BUDGET, budget // 2))
+    prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+    remaining = budget - count_tokens(prompt) - HISTORY_SUMMARY_TOKENS
+
+    kept = []
+    for index in range(len(history) - 1, -1, -1):
+        msg, role = history[index]
+        content = msg.split(SOURCES_MARKER)[0] if role == "assistant" else msg
+        tokens = count_tokens(content)
+        if tokens > remaining:
+            break
+        kept.append({"role": role, "content": content})
+        remaining -= tokens
+    else:
+        index = -1
+    kept.reverse()
+
+    messages = []
+    summary = summarize_turns(history[:index + 1])
+    if summary:
+        messages.append({"role": "system", "content": summary})
+    messages.extend(kept)
+    messages.append({"role": "user", "content": prompt})
+    prompt_tokens = sum(count_tokens(m['content']) for m in messages)
+    incr("prompt_tokens_total", prompt_tokens)
+    print(f"[🧮 Prompt] {prompt_tokens} tokens, history turns kept: {len(kept)}/{len(history)}")
+    return messages
+
+
+def fake_stream(messages: List[dict]) -> Iterator[str]:
+    # Offline provider for tests and benchmarks: streams the first context
+    # line back word by word, so output depends only on the prompt.
+    prompt = messages[-1]["content"]
+    context = prompt.split("Context:", 1)[-1].strip().split("\n", 1)[0]
+    for word in f"Based on the documents: {context[:400]}".split(" "):
+        yield word + " "
+
+
+_clients = {}
+
+def _client(provider: str):
+    if provider not in _clients:
+        if provider == "openrouter":
+            _clients[provider] = OpenAI(api_key=OPENROUTER_API_KEY, base_url=OPENROUTER_BASE_URL)
+        else:
+            _clients[provider] = ChatOpenAI(openai_api_key=OPENAI_API_KEY, model=OPENAI_CHAT_MODEL,
+                                            temperature=0, streaming=True)
+    return _clients[provider]
+
+
+def stream_answer(messages: List[dict], provider: str = LLM_PROVIDER) -> Iterator[str]:
+    with span("generation", provider=provider) as fields:
+        started = time.perf_counter()
+        first_token = None
+        if provider == "openrouter":
+            print("[LLM] Using OpenRouter")
+            response = _client(provider).chat.completions.create(
+                model=OPENROUTER_CHAT_MODEL, messages=messages, stream=True
+            )
+            deltas = (event.choices[0].delta.content for event in response if event.choices)
+        elif provider == "fake":
+            deltas = fake_stream(messages)
+        else:
+            print("[LLM] Using OpenAI")
+            deltas = (chunk.content for chunk in _client(provider).stream(messages))
+
+        for delta in deltas:
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                observe("llm_ttft_seconds", first_token, provider=provider)
+                fields["ttft"] = round(first_token, 4)
+                print(f"[⏱️ LLM] Time to first token: {first_token:.2f}s")
+            yield delta
+        print(f"[⏱️ LLM] Completed in {time.perf_counter() - started:.2f}s")
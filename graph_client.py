@@ -0,0 +1,218 @@
+import os, json, threading, time
+from typing import Generator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from metrics import incr
+
+load_dotenv()
+
+TENANT_ID = os.getenv("TENANT_ID")
+CLIENT_ID = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+SHAREPOINT_SITE = os.getenv("SITE_URL_NEW")
+GRAPH_URL = os.getenv("GRAPH_URL", "https://graph.microsoft.com/v1.0").rstrip("/")
+GRAPH_LOGIN_URL = os.getenv("GRAPH_LOGIN_URL", "https://login.microsoftonline.com").rstrip("/")
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "16"))
+GRAPH_IDS_FILE = os.getenv("GRAPH_IDS_FILE", "graph_ids.json")
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry to fetch a new token
+
+
+def build_session(max_retries: int = GRAPH_MAX_RETRIES, pool_size: int = GRAPH_POOL_SIZE) -> requests.Session:
+    # Graph throttles with 429/503 and a Retry-After header; urllib3 sleeps for
+    # that long before retrying, and falls back to exponential backoff without it.
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=1,
+        status_forcelist=(429, 503),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class GraphClient:
+    # One per process (see get_graph()): a pooled, retrying session, an app
+    # token reused until shortly before it expires, and site/drive IDs that
+    # are resolved once and remembered in GRAPH_IDS_FILE across runs (and
+    # resolved again if the site or drive is recreated; see _with_fresh_ids).
+
+    def __init__(self, tenant_id: str = TENANT_ID, client_id: str = CLIENT_ID, client_secret: str = CLIENT_SECRET,
+                 site_url: str = SHAREPOINT_SITE, graph_url: str = GRAPH_URL, login_url: str = GRAPH_LOGIN_URL,
+                 ids_file: Optional[str] = GRAPH_IDS_FILE):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.site_url = site_url
+        self.graph_url = graph_url
+        self.login_url = login_url
+        self.ids_file = ids_file
+        self.session = build_session()
+        self.token_requests = 0
+        self._lock = threading.Lock()
+        self._token = None
+        self._token_expires_at = 0.0
+        self._ids = self._load_ids()
+
+    def access_token(self) -> str:
+        with self._lock:
+            if self._token and time.time() < self._token_expires_at - TOKEN_REFRESH_MARGIN:
+                return self._token
+            res = self.session.post(
+                f"{self.login_url}/{self.tenant_id}/oauth2/v2.0/token",
+                data={
+                    "grant_type": "client_credentials",
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                    "scope": GRAPH_SCOPE,
+                },
+            )
+            res.raise_for_status()
+            body = res.json()
+            self._token = body["access_token"]
+            self._token_expires_at = time.time() + float(body.get("expires_in", 3599))
+            self.token_requests += 1
+            incr("graph_token_requests_total")
+            return self._token
+
+    def _invalidate_token(self, token: str):
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.access_token()}"}
+
+    def url(self, path_or_url: str) -> str:
+        return path_or_url if path_or_url.startswith("http") else f"{self.graph_url}/{path_or_url.lstrip('/')}"
+
+    def request(self, method: str, path_or_url: str, **kwargs) -> requests.Response:
+        # A 404 on a URL built from a cached site/drive ID is retried once with
+        # freshly resolved IDs if the cached ones turn out to be stale.
+        res = self._send(method, path_or_url, **kwargs)
+        if res.status_code == 404:
+            fresh_url = self._with_fresh_ids(self.url(path_or_url))
+            if fresh_url:
+                res.close()
+                res = self._send(method, fresh_url, **kwargs)
+        return res
+
+    def _send(self, method: str, path_or_url: str, **kwargs) -> requests.Response:
+        # A 401 means the token was revoked or expired early: fetch a new one
+        # and retry once.
+        extra_headers = kwargs.pop("headers", {})
+        for attempt in range(2):
+            token = self.access_token()
+            res = self.session.request(method, self.url(path_or_url),
+                                       headers={**extra_headers, "Authorization": f"Bearer {token}"}, **kwargs)
+            # urllib3 records the 429/503 retries it made behind this response.
+            retries = getattr(getattr(res.raw, "retries", None), "history", ())
+            incr("api_retries_total", len(retries), api="graph")
+            incr("graph_requests_total", method=method, status=res.status_code)
+            if res.status_code != 401 or attempt:
+                return res
+            res.close()
+            incr("api_retries_total", api="graph_auth")
+            self._invalidate_token(token)
+        return res
+
+    def get(self, path_or_url: str, **kwargs) -> requests.Response:
+        return self.request("GET", path_or_url, **kwargs)
+
+    def post(self, path_or_url: str, **kwargs) -> requests.Response:
+        return self.request("POST", path_or_url, **kwargs)
+
+    def delete(self, path_or_url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path_or_url, **kwargs)
+
+    def get_json(self, path_or_url: str) -> dict:
+        res = self.get(path_or_url)
+        res.raise_for_status()
+        return res.json()
+
+    def iter_pages(self, path_or_url: str) -> Generator[dict, None, None]:
+        # Graph caps collection responses at ~200 items and links the rest.
+        url = path_or_url
+        while url:
+            page = self.get_json(url)
+            yield page
+            url = page.get("@odata.nextLink")
+
+    def _load_ids(self) -> dict:
+        if not self.ids_file or not os.path.exists(self.ids_file):
+            return {}
+        try:
+            with open(self.ids_file, "r") as f:
+                return json.load(f).get(self.site_url or "", {})
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_ids(self):
+        if not self.ids_file:
+            return
+        try:
+            with open(self.ids_file, "r") as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            stored = {}
+        stored[self.site_url or ""] = self._ids
+        tmp_path = f"{self.ids_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stored, f, indent=2)
+        os.replace(tmp_path, self.ids_file)
+
+    def site_id(self) -> str:
+        if "site_id" not in self._ids:
+            site_name = self.site_url.split("/")[-1]
+            self._ids["site_id"] = self.get_json(f"sites/root:/sites/{site_name}")["id"]
+            self._save_ids()
+        return self._ids["site_id"]
+
+    def drive_id(self) -> str:
+        if "drive_id" not in self._ids:
+            self._ids["drive_id"] = self.get_json(f"sites/{self.site_id()}/drive")["id"]
+            self._save_ids()
+        return self._ids["drive_id"]
+
+    def forget_ids(self):
+        # For when a cached ID stops resolving (site or drive recreated).
+        self._ids = {}
+        self._save_ids()
+
+    def _with_fresh_ids(self, url: str) -> Optional[str]:
+        # Called on a 404. Most are about the item (deleted file), so the cached
+        # drive (or site) in the URL is probed first; only if that is gone too
+        # are the IDs forgotten and resolved again. Returns the URL with the new
+        # IDs, or None when the cached ones are still good.
+        cached = {key: value for key, value in self._ids.items() if value in url}
+        if not cached:
+            return None
+        probe_path = f"drives/{cached['drive_id']}" if "drive_id" in cached else f"sites/{cached['site_id']}"
+        probe = self._send("GET", f"{probe_path}?$select=id")
+        probe.close()
+        if probe.status_code != 404:
+            return None
+        print(f"[⚠️ Graph IDs] Cached IDs no longer resolve ({', '.join(sorted(cached))}); looking them up again")
+        incr("graph_id_refreshes_total")
+        self.forget_ids()
+        for key, value in cached.items():
+            url = url.replace(value, getattr(self, key)())
+        return url
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph() -> GraphClient:
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = GraphClient()
+        return _graph
@@ -0,0 +1,95 @@
+import os, json
+from datetime import datetime, timezone
+
+INDEX_VERSION_FILE = "index_version.json"
+HEALTH_PAGE_SIZE = 1000
+COPY_PAGE_SIZE = 1000
+DEFAULT_COLLECTION = "langchain"  # langchain_chroma's default, used before any blue/green build
+COLLECTION_PREFIX = "sharepoint_g"
+
+
+def read_index_version() -> dict:
+    # Readers poll this on every query, so it is a tiny file rather than a
+    # query against Chroma. A missing file means "generation 0".
+    try:
+        with open(INDEX_VERSION_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"generation": 0, "updated_at": None, "collection": DEFAULT_COLLECTION}
+
+
+def active_collection(version: dict) -> str:
+    return version.get("collection", DEFAULT_COLLECTION)
+
+
+def generation_collection(generation: int) -> str:
+    return f"{COLLECTION_PREFIX}{generation}"
+
+
+def bump_index_version(**extra) -> dict:
+    version = read_index_version()
+    version.update(extra)
+    version["generation"] = version.get("generation", 0) + 1
+    version["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    # Write-then-rename so readers never see a half-written marker.
+    tmp_path = f"{INDEX_VERSION_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(version, f, indent=2)
+    os.replace(tmp_path, INDEX_VERSION_FILE)
+    return version
+
+
+def check_index_health(collection) -> dict:
+    # Full O(N) scan for chunks with missing text, paged so it never loads the
+    # whole collection at once. Run after ingest or on demand, not per query.
+    total = collection.count()
+    broken = 0
+    for offset in range(0, total, HEALTH_PAGE_SIZE):
+        page = collection.get(include=["documents"], limit=HEALTH_PAGE_SIZE, offset=offset)
+        broken += sum(1 for doc in page["documents"] if not doc)
+    return {"total_chunks": total, "broken_chunks": broken}
+
+
+def copy_collection(source, target):
+    # Seeds a shadow collection with the live one, embeddings included, so an
+    # incremental blue/green run only re-embeds what actually changed.
+    total = source.count()
+    for offset in range(0, total, COPY_PAGE_SIZE):
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=COPY_PAGE_SIZE, offset=offset)
+        if page["ids"]:
+            target.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+            )
+    return total
+
+
+def collection_names(client) -> list:
+    # Chroma < 0.6 returns Collection objects, newer versions return names.
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+def gc_generations(client, active: str, keep: int) -> list:
+    # Keeps the active generation plus the (keep - 1) before it, so readers
+    # still holding the previous handle can finish their queries. Unpromoted
+    # shadows from crashed runs (generation above the active one) are dropped.
+    generations = sorted(
+        int(name[len(COLLECTION_PREFIX):])
+        for name in collection_names(client)
+        if name.startswith(COLLECTION_PREFIX) and name[len(COLLECTION_PREFIX):].isdigit()
+    )
+    active_generation = int(active[len(COLLECTION_PREFIX):]) if active.startswith(COLLECTION_PREFIX) else 0
+    retained = [g for g in generations if g <= active_generation][-keep:]
+    removed = []
+    for generation in generations:
+        if generation not in retained:
+            client.delete_collection(generation_collection(generation))
+            removed.append(generation_collection(generation))
+    # The pre-blue/green collection goes once a generation has replaced it.
+    if active != DEFAULT_COLLECTION and DEFAULT_COLLECTION in collection_names(client) and keep <= len(retained):
+        client.delete_collection(DEFAULT_COLLECTION)
+        removed.append(DEFAULT_COLLECTION)
+    return removed
@@ -0,0 +1,242 @@
+import os, json, math, re, threading, time
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage
+from query_cache import TTLCache, normalize_question
+from metrics import span
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+INTENT_BACKEND = os.getenv("INTENT_BACKEND", "local")  # "local", "heuristic" or "llm"
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+# Sending a real question to small talk is worse than an extra LLM call, so
+# "casual" needs more confidence before the local decision is trusted.
+INTENT_CASUAL_THRESHOLD = float(os.getenv("INTENT_CASUAL_THRESHOLD", "0.9"))
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "intent_log.jsonl")
+INTENT_LOG_MAX_BYTES = int(os.getenv("INTENT_LOG_MAX_BYTES", str(5 * 1024 * 1024)))  # then rotated to <path>.1
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "5000"))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "86400"))  # seconds
+
+INFO_KEYWORDS = [
+    "what", "how", "explain", "give me", "tell me", "who", "where", "when",
+    "document", "file", "details", "report", "show", "find", "source"
+]
+
+# Seed training set. Decisions the LLM makes in production are appended to
+# INTENT_LOG_PATH and folded in on the next start, so the local model learns
+# the phrasing our users actually use.
+SEED_EXAMPLES = [
+    ("what is the travel reimbursement policy", True),
+    ("how do i request annual leave", True),
+    ("find the q3 sales report", True),
+    ("show me the onboarding checklist", True),
+    ("who approves purchase orders over 10k", True),
+    ("where is the latest org chart", True),
+    ("summarize the project charter", True),
+    ("list the steps to reset a vpn token", True),
+    ("details of invoice po-5531", True),
+    ("which document covers data retention", True),
+    ("do we have a template for meeting minutes", True),
+    ("deadline for the budget submission", True),
+    ("what does the contract say about termination", True),
+    ("give me the safety procedure for the lab", True),
+    ("explain the expense approval workflow", True),
+    ("pricing sheet for enterprise customers", True),
+    ("when is the next audit scheduled", True),
+    ("can you check the hr handbook for remote work rules", True),
+    ("budget 2024", True),
+    ("q3 revenue numbers", True),
+    ("status of ticket inc-20417", True),
+    ("holiday calendar", True),
+    ("security guidelines for laptops", True),
+    ("vacation carryover rule", True),
+    ("refund policy", True),
+    ("minutes from the board meeting", True),
+    ("hi", False),
+    ("hello there", False),
+    ("hey, how are you", False),
+    ("good morning", False),
+    ("thanks", False),
+    ("thank you so much", False),
+    ("ok cool", False),
+    ("bye", False),
+    ("see you later", False),
+    ("lol that's funny", False),
+    ("you're awesome", False),
+    ("nice", False),
+    ("great, thanks for the help", False),
+    ("what's up", False),
+    ("how's it going", False),
+    ("good night", False),
+    ("haha", False),
+    ("who are you", False),
+    ("tell me a joke", False),
+    ("good afternoon", False),
+    ("cheers mate", False),
+    ("awesome, thank you", False),
+    ("how are you doing today", False),
+    ("sounds good", False),
+]
+
+CALIBRATION = 6.0
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def features(text: str) -> List[str]:
+    # Words, word bigrams and character trigrams: enough to separate "how are
+    # you" from "how do I..." without a vocabulary of the whole corpus.
+    text = normalize_question(text)
+    words = WORD_RE.findall(text)
+    feats = [f"w:{w}" for w in words]
+    feats += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    feats += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if any(ch.isdigit() for ch in text):
+        feats.append("has:digit")
+    return feats
+
+
+def is_information_query_heuristic(user_input: str) -> bool:
+    result = any(kw in user_input.lower() for kw in INFO_KEYWORDS)
+    print(f"[Heuristic] '{user_input}' → Match: {result}")
+    return result
+
+
+_classifier_llm = None
+
+def is_information_query_llm(user_input: str) -> bool:
+    global _classifier_llm
+    prompt = f"""
+Decide if the following user input is asking for information from documents (e.g., question, file search) or just casual/small talk.
+
+Input: "{user_input}"
+Answer only with "yes" or "no".
+"""
+    if _classifier_llm is None:
+        _classifier_llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18", openai_api_key=OPENAI_API_KEY, temperature=0)
+    result = _classifier_llm.invoke([HumanMessage(content=prompt)])
+    decision = result.content.strip().lower()
+    print(f"[LLM Intent Classifier] Decision: {decision}")
+    return decision == "yes"
+
+
+class NaiveBayesIntent:
+    # Multinomial naive Bayes over features(); trains in milliseconds on a few
+    # thousand examples and classifies in microseconds, CPU only.
+
+    def __init__(self, examples: Iterable[Tuple[str, bool]]):
+        self.counts = {True: Counter(), False: Counter()}
+        self.docs = Counter()
+        for text, label in examples:
+            self.counts[label].update(features(text))
+            self.docs[label] += 1
+        self.totals = {label: sum(counter.values()) for label, counter in self.counts.items()}
+        self.vocabulary = len(set(self.counts[True]) | set(self.counts[False])) or 1
+
+    def predict(self, text: str) -> Tuple[bool, float]:
+        feats = features(text) or ["w:"]
+        total_docs = sum(self.docs.values()) or 1
+        log_probs = {}
+        for label in (True, False):
+            log_prob = math.log((self.docs[label] + 1) / (total_docs + 2))
+            denominator = self.totals[label] + self.vocabulary
+            for feature in feats:
+                log_prob += math.log((self.counts[label][feature] + 1) / denominator)
+            log_probs[label] = log_prob
+        # Naive Bayes treats overlapping n-grams as independent evidence, which
+        # makes raw posteriors wildly overconfident. Averaging the log odds per
+        # feature gives a confidence the fallback threshold can work with.
+        margin = (log_probs[True] - log_probs[False]) * CALIBRATION / len(feats)
+        p_info = 1 / (1 + math.exp(-max(min(margin, 50), -50)))
+        return (p_info >= 0.5, max(p_info, 1 - p_info))
+
+
+def load_logged_examples(path: str = INTENT_LOG_PATH) -> List[Tuple[str, bool]]:
+    # Reads the rotated file first, so the newest label for a query wins.
+    labels = {}
+    for log_file in (path + ".1", path):
+        if not os.path.exists(log_file):
+            continue
+        with open(log_file, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("source") == "llm" and "query" in entry:
+                    labels[entry["query"]] = bool(entry["is_information"])
+    return list(labels.items())
+
+
+class IntentStage:
+    # cache -> local classifier -> keyword heuristic -> LLM fallback. When the
+    # local model is less sure than the threshold for the label it picked, an
+    # information keyword settles it as a question; only inputs with neither
+    # go to the LLM. "heuristic" keeps the old keyword-then-LLM behaviour;
+    # "llm" always asks the model.
+
+    def __init__(self, backend: str = INTENT_BACKEND, threshold: float = INTENT_CONFIDENCE_THRESHOLD,
+                 log_path: Optional[str] = INTENT_LOG_PATH):
+        self.backend = backend
+        self.threshold = threshold
+        self.log_path = log_path
+        self.cache = TTLCache(INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL, name="intent")
+        self._log_lock = threading.Lock()
+        self.model = None
+        if backend == "local":
+            logged = load_logged_examples(log_path) if log_path else []
+            self.model = NaiveBayesIntent(SEED_EXAMPLES + logged)
+            print(f"[Intent] Local classifier trained on {len(SEED_EXAMPLES)} seed + {len(logged)} logged example(s)")
+
+    def _log(self, query: str, is_information: bool, confidence: float, source: str):
+        # Only LLM decisions are training data; the rest would just grow the file.
+        # Past INTENT_LOG_MAX_BYTES the log moves to <path>.1 (replacing the
+        # previous one), so at most two files' worth is kept and re-read.
+        if not self.log_path or source != "llm":
+            return
+        entry = {"ts": time.time(), "query": query, "is_information": is_information,
+                 "confidence": round(confidence, 4), "source": source}
+        with self._log_lock:
+            try:
+                if os.path.getsize(self.log_path) >= INTENT_LOG_MAX_BYTES:
+                    os.replace(self.log_path, self.log_path + ".1")
+            except FileNotFoundError:
+                pass  # first entry, or another process rotated it just now
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _decide(self, user_input: str) -> Tuple[bool, float, str]:
+        if self.backend == "llm":
+            return is_information_query_llm(user_input), 1.0, "llm"
+        if self.backend == "heuristic":
+            if is_information_query_heuristic(user_input):
+                return True, 1.0, "heuristic"
+            return is_information_query_llm(user_input), 1.0, "llm"
+
+        decision, confidence = self.model.predict(user_input)
+        print(f"[Intent] Local: {'information' if decision else 'casual'} ({confidence:.2f})")
+        required = self.threshold if decision else max(self.threshold, INTENT_CASUAL_THRESHOLD)
+        if confidence >= required:
+            return decision, confidence, "local"
+        # Checked only after the classifier, which is confident about small talk
+        # like "tell me a joke" or "what's up" that also contains a keyword.
+        if is_information_query_heuristic(user_input):
+            return True, confidence, "heuristic"
+        return is_information_query_llm(user_input), 1.0, "llm"
+
+    def is_information_query(self, user_input: str) -> bool:
+        with span("intent") as fields:
+            key = normalize_question(user_input)
+            cached = self.cache.get(key)
+            if cached is not None:
+                print(f"[Intent] Cached decision: {cached}")
+                fields["source"] = "cache"
+                return cached
+            decision, confidence, source = self._decide(user_input)
+            fields["source"] = source
+            self.cache.put(key, decision)
+            self._log(key, decision, confidence, source)
+            return decision
@@ -1,34 +1,11 @@
-import requests
-import os
 from dotenv import load_dotenv
+from graph_client import get_graph
 
 # Load .env
 load_dotenv()
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-
-def get_access_token():
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default"
-    }
-    headers = { "Content-Type": "application/x-www-form-urlencoded" }
-
-    res = requests.post(url, data=data, headers=headers)
-    res.raise_for_status()
-    return res.json()["access_token"]
-
-def list_subscriptions(token):
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-
-    res = requests.get("https://graph.microsoft.com/v1.0/subscriptions", headers=headers)
+def list_subscriptions(graph):
+    res = graph.get("subscriptions")
 
     if res.status_code == 200:
         data = res.json()
@@ -48,5 +25,4 @@ def list_subscriptions(token):
         print(res.text)
 
 if __name__ == "__main__":
-    token = get_access_token()
-    list_subscriptions(token)
\ No newline at end of file
+    list_subscriptions(get_graph())
\ No newline at end of file
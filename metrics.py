@@ -0,0 +1,158 @@
+import os, json, logging, threading, time
+from contextlib import contextmanager
+from logging.handlers import WatchedFileHandler
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH", "metrics_log.jsonl")  # empty disables JSON logs
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_RUNS = os.getenv("PROFILE_RUNS", "0") == "1"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf"))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Registry:
+    # Process-local counters, gauges and duration histograms, rendered in the
+    # Prometheus text format by render(). Everything is labelled by keyword
+    # arguments, e.g. incr("files_total", status="indexed").
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, list]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            state = series.setdefault(_labels(labels), [[0] * len(BUCKETS), 0.0, 0])
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        def fmt(key: LabelKey, extra: LabelKey = ()) -> str:
+            pairs = key + extra
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{fmt(key)} {value:g}" for key, value in series.items())
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{fmt(key)} {value:g}" for key, value in series.items())
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, (buckets, total, count) in series.items():
+                    for bound, bucket_count in zip(BUCKETS, buckets):
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{fmt(key, (('le', le),))} {bucket_count}")
+                    lines.append(f"{name}_sum{fmt(key)} {total:g}")
+                    lines.append(f"{name}_count{fmt(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+incr = registry.incr
+set_gauge = registry.set_gauge
+observe = registry.observe
+render_prometheus = registry.render
+
+
+def _json_logger():
+    # Streamlit, both FastAPI apps, the sync and its parse workers all append to
+    # the same file. Rotating it from inside one of them would pull it out from
+    # under the others, so rotation is left to logrotate: WatchedFileHandler
+    # reopens the path once it has been moved. Opened lazily, so forked workers
+    # don't share a descriptor.
+    logger = logging.getLogger("metrics")
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if METRICS_LOG_PATH:
+            handler = WatchedFileHandler(METRICS_LOG_PATH, delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        else:
+            logger.addHandler(logging.NullHandler())
+    return logger
+
+_logger = _json_logger()
+
+
+def log_event(event: str, **fields):
+    _logger.info(json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "event": event, **fields}, default=str))
+
+
+@contextmanager
+def span(stage: str, **labels):
+    # Times a pipeline stage into stage_seconds{stage=...} and logs it as one
+    # JSON line. Extra fields can be attached while it runs: `s["chunks"] = n`.
+    fields = {}
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        observe("stage_seconds", seconds, stage=stage, **labels)
+        log_event("span", stage=stage, seconds=round(seconds, 4), status=status, **labels, **fields)
+
+
+_profiling = False
+
+@contextmanager
+def profiled(name: str, enabled: bool = None):
+    # Opt-in cProfile of one run (PROFILE_RUNS=1 or enabled=True). Writes
+    # profiles/<name>-<timestamp>.prof for snakeviz/pstats and prints the top
+    # functions by cumulative time.
+    global _profiling
+    if _profiling or not (PROFILE_RUNS if enabled is None else enabled):
+        yield  # nested runs (main() called from a targeted reindex) share the outer profile
+        return
+    import cProfile, pstats
+    profiler = cProfile.Profile()
+    _profiling = True
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profiling = False
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        print(f"[🔬 Profile] Written to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
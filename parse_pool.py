@@ -0,0 +1,199 @@
+import importlib, importlib.util, multiprocessing, os, queue, sys, threading, time
+from multiprocessing.connection import wait
+from typing import Callable, Generator, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from metrics import incr
+
+load_dotenv()
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS") or os.cpu_count() or 1)  # empty means CPU count
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "600"))  # seconds per file
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _FeederError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _target_ref(target: Callable) -> Tuple[str, str]:
+    # Workers look the target up by name rather than unpickling it, so they can
+    # report a failed preload before the import happens. A script's functions
+    # live in __main__; workers import the same file under its module name,
+    # which is the name that gets preloaded.
+    module = target.__module__
+    if module == "__main__":
+        module = os.path.splitext(os.path.basename(sys.modules["__main__"].__file__))[0]
+    return module, target.__qualname__
+
+
+def _export_module_paths(modules: Iterable[str]):
+    # The forkserver is started with `python -c` and (up to Python 3.11) ignores
+    # the sys.path it is sent, so it only finds modules through the cwd and
+    # PYTHONPATH. Put the preloaded modules' directories on PYTHONPATH so the
+    # preload works whatever directory the sync is started from.
+    paths = os.environ.get("PYTHONPATH", "").split(os.pathsep) if os.environ.get("PYTHONPATH") else []
+    added = []
+    for name in modules:
+        spec = importlib.util.find_spec(name.split(".")[0])
+        if spec is None:
+            continue
+        location = spec.submodule_search_locations[0] if spec.submodule_search_locations else spec.origin
+        if not location:
+            continue
+        directory = os.path.dirname(os.path.abspath(location))
+        if directory not in paths and directory not in added:
+            added.append(directory)
+    if added:
+        os.environ["PYTHONPATH"] = os.pathsep.join(added + paths)
+
+
+def _serve(conn, target_ref: Tuple[str, str], preload: Tuple[str, ...]):
+    # Worker loop: report which preloaded modules are missing, then run jobs
+    # until the parent closes the pipe.
+    conn.send([name for name in preload if name not in sys.modules])
+    module, qualname = target_ref
+    target = importlib.import_module(module)
+    for attr in qualname.split("."):
+        target = getattr(target, attr)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        try:
+            conn.send((True, target(*job)))
+        except BaseException as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx, target_ref: Tuple[str, str], preload: Tuple[str, ...]):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(child, target_ref, preload), daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+        self.job = None
+        self.deadline = None
+
+    def submit(self, job: tuple, timeout: float):
+        self.job = job
+        self.deadline = time.monotonic() + timeout
+        self.conn.send(job)
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        self.conn.close()  # an idle worker exits on EOF
+        self.process.join(timeout=None if kill else 5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+def _feed(jobs: Iterable[tuple], job_queue: queue.Queue):
+    try:
+        for job in jobs:
+            job_queue.put(job)
+    except BaseException as e:
+        job_queue.put(_FeederError(e))
+    job_queue.put(_DONE)
+
+
+def parse_in_pool(
+    target: Callable,
+    jobs: Iterable[tuple],
+    workers: int = PARSE_WORKERS,
+    timeout: float = PARSE_TIMEOUT,
+    preload: Tuple[str, ...] = (),
+) -> Generator[Tuple[tuple, object, Optional[str]], None, None]:
+    # Runs target(*job) for every job on a pool of at most `workers` long-lived
+    # worker processes and yields (job, result, error) in completion order. A
+    # job that exceeds `timeout` has its worker killed (and replaced on demand)
+    # and is reported as an error instead of stalling the rest of the run.
+    # `jobs` is consumed on a feeder thread so a slow producer (downloads) never
+    # blocks result handling. `target` must be a module-level function.
+    if workers <= 0:
+        for job in jobs:
+            try:
+                yield job, target(*job), None
+            except Exception as e:
+                yield job, None, f"{type(e).__name__}: {e}"
+        return
+
+    # forkserver forks each worker from a clean, preloaded server process: cheap
+    # like fork, but safe while the parent is running download threads.
+    ctx = multiprocessing.get_context("forkserver")
+    _export_module_paths(preload)
+    ctx.set_forkserver_preload(list(preload))
+    target_ref = _target_ref(target)
+
+    job_queue = queue.Queue(maxsize=workers)
+    threading.Thread(target=_feed, args=(jobs, job_queue), daemon=True).start()
+
+    busy = {}  # connection -> worker
+    idle = []
+    warned = False
+    exhausted = False
+    try:
+        while not exhausted or busy:
+            while not exhausted and len(busy) < workers:
+                try:
+                    job = job_queue.get(timeout=POLL_INTERVAL) if not busy else job_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _DONE:
+                    exhausted = True
+                    break
+                if isinstance(job, _FeederError):
+                    raise job.error
+                worker = idle.pop() if idle else None
+                if worker is None or not worker.process.is_alive():
+                    if worker is not None:
+                        worker.stop(kill=True)
+                    worker = _Worker(ctx, target_ref, preload)
+                worker.submit(job, timeout)
+                busy[worker.conn] = worker
+
+            if not busy:
+                continue
+
+            next_deadline = min(worker.deadline for worker in busy.values())
+            for conn in wait(list(busy), timeout=max(0.0, min(POLL_INTERVAL, next_deadline - time.monotonic()))):
+                worker = busy[conn]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    del busy[conn]
+                    worker.stop(kill=True)
+                    yield worker.job, None, f"worker exited with code {worker.process.exitcode}"
+                    continue
+                if not worker.ready:
+                    worker.ready = True
+                    if message and not warned:
+                        warned = True
+                        print(f"[⚠️ Parse Pool] Preload failed for {', '.join(message)}; "
+                              f"each worker imports it itself (check PYTHONPATH)")
+                    if message:
+                        incr("parse_preload_misses_total")
+                    continue
+                del busy[conn]
+                idle.append(worker)
+                ok, payload = message
+                yield (worker.job, payload, None) if ok else (worker.job, None, payload)
+
+            now = time.monotonic()
+            for conn, worker in list(busy.items()):
+                if worker.deadline <= now:
+                    del busy[conn]
+                    worker.stop(kill=True)
+                    yield worker.job, None, f"timed out after {timeout:g}s"
+    finally:
+        for worker in busy.values():
+            worker.stop(kill=True)
+        for worker in idle:
+            worker.stop()
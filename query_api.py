@@ -0,0 +1,245 @@
+### ASYNC QUERY SERVICE: RETRIEVE AND ANSWER OVER HTTP, ONE SHARED INDEX HANDLE PER PROCESS ###
+
+__import__('pysqlite3')
+import sys
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+import os, asyncio, threading, time
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from langchain_chroma import Chroma
+from chromadb.api.client import SharedSystemClient
+from embedding_cache import get_embedding_model
+from index_state import read_index_version, active_collection
+from retrieval import BM25Index, HybridRetriever, bm25_path, build_where
+from query_cache import QueryCache, normalize_question
+from sync_manifest import scope_options
+from generation import LLM_PROVIDER, SOURCES_MARKER, build_messages, stream_answer
+from metrics import incr, render_prometheus, set_gauge, span
+
+load_dotenv()
+CHROMA_PATH = "chroma_db"
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "10"))
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "64"))
+NOT_FOUND_ANSWER = "❌ I couldn't find relevant information for that."
+
+app = FastAPI()
+
+
+class EmbeddingBatcher:
+    # Collects query embeddings requested within QUERY_BATCH_WINDOW_MS of each
+    # other (up to QUERY_BATCH_MAX) and sends them as one embed_documents
+    # call, so a burst of concurrent users costs one API round-trip.
+
+    def __init__(self, embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_BATCH_MAX):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                with span("query_embedding") as fields:
+                    fields.update(queries=len(batch), unique=len(texts))
+                    vectors = await asyncio.to_thread(self.embeddings.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            by_text = dict(zip(texts, vectors))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+            self.batches += 1
+            self.queries += len(batch)
+            if len(batch) > 1:
+                print(f"[📦 Query Batch] {len(batch)} queries → 1 embedding call ({len(texts)} unique)")
+
+
+class IndexHandle:
+    # One Chroma client + BM25 index shared by every request, reloaded when
+    # create_vectordb bumps the index generation (same rules as streamlit_app).
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._retriever = None
+        self._loaded_collections = set()
+        self.embeddings = get_embedding_model(cached=False)
+
+    def current(self) -> Tuple[int, HybridRetriever]:
+        version = read_index_version()
+        key = (version.get("generation", 0), active_collection(version))
+        with self._lock:
+            if key != self._key:
+                generation, collection = key
+                print(f"[Vectorstore] Loading ChromaDB collection {collection} for generation {generation}...")
+                if collection in self._loaded_collections:
+                    SharedSystemClient.clear_system_cache()
+                self._loaded_collections.add(collection)
+                db = Chroma(collection_name=collection, persist_directory=CHROMA_PATH,
+                            embedding_function=self.embeddings)
+                self._retriever = HybridRetriever(db, BM25Index(bm25_path(collection)))
+                self._key = key
+            return self._key[0], self._retriever
+
+
+index = IndexHandle()
+cache = QueryCache()
+batcher = EmbeddingBatcher(index.embeddings)
+
+
+class ScopeFilters(BaseModel):
+    # Restricts retrieval before the ANN search; see retrieval.build_where.
+    top_folders: List[str] = []
+    folders: List[str] = []
+    file_types: List[str] = []
+    modified_after: Optional[float] = None  # unix seconds
+
+    def where(self) -> Optional[dict]:
+        return build_where(self.top_folders, self.folders, self.file_types, self.modified_after)
+
+
+class RetrieveRequest(BaseModel):
+    question: str
+    k: Optional[int] = None
+    filters: Optional[ScopeFilters] = None
+
+
+class AnswerRequest(BaseModel):
+    question: str
+    history: List[Tuple[str, str]] = []  # [(message, role)] oldest first, without the question
+    k: Optional[int] = None
+    stream: bool = False
+    filters: Optional[ScopeFilters] = None
+
+
+@app.on_event("startup")
+async def start_batcher():
+    batcher.start()
+
+
+async def retrieve(question: str, k: Optional[int], filters: Optional[ScopeFilters] = None):
+    generation, retriever = await asyncio.to_thread(index.current)
+    cache.sync_generation(generation)
+    # Same two-level cache as Streamlit; misses go through the batcher.
+    normalized = normalize_question(question)
+    query_embedding = cache.embeddings.get(normalized)
+    if query_embedding is None:
+        query_embedding = await batcher.embed(question)
+        cache.embeddings.put(normalized, query_embedding)
+    where = filters.where() if filters else None
+    results = await asyncio.to_thread(retriever.retrieve, question, query_embedding, k, where)
+    return generation, results
+
+
+def serialize(chunk) -> dict:
+    return {
+        "chunk_id": chunk.chunk_id,
+        "text": chunk.doc.page_content,
+        "metadata": chunk.doc.metadata,
+        "score": chunk.score,
+        "vector_score": chunk.vector_score,
+        "lexical_score": chunk.lexical_score,
+        "coverage": chunk.coverage,
+    }
+
+
+@app.post("/retrieve")
+async def retrieve_endpoint(request: RetrieveRequest):
+    incr("queries_total", endpoint="retrieve")
+    started = time.perf_counter()
+    generation, results = await retrieve(request.question, request.k, request.filters)
+    return {
+        "generation": generation,
+        "chunks": [serialize(chunk) for chunk in results],
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+@app.post("/answer")
+async def answer_endpoint(request: AnswerRequest):
+    incr("queries_total", endpoint="answer")
+    generation, results = await retrieve(request.question, request.k, request.filters)
+    headers = {"X-Index-Generation": str(generation), "X-Retrieved-Chunks": str(len(results))}
+    if not results:
+        if request.stream:
+            return StreamingResponse(iter([NOT_FOUND_ANSWER]), media_type="text/plain", headers=headers)
+        return {"generation": generation, "answer": NOT_FOUND_ANSWER, "chunks": []}
+
+    history = [tuple(turn) for turn in request.history]
+    answer_key = cache.answer_key(request.question, [chunk.chunk_id for chunk in results], LLM_PROVIDER,
+                                  history=history)
+    cached = cache.get_answer(answer_key)
+    sources = list({chunk.doc.metadata.get("source", "unknown") for chunk in results})
+    formatted_sources = (SOURCES_MARKER + "\n" + "\n".join(f"- [{src}]({src})" for src in sources)) if sources else ""
+
+    def tokens():
+        # Runs in Starlette's threadpool; the answer is cached once complete.
+        if cached is not None:
+            yield cached
+            return
+        messages = build_messages(request.question, [chunk.doc.page_content for chunk in results], history)
+        parts = []
+        for delta in stream_answer(messages):
+            parts.append(delta)
+            yield delta
+        parts.append(formatted_sources)
+        yield formatted_sources
+        cache.put_answer(answer_key, "".join(parts))
+
+    if request.stream:
+        return StreamingResponse(tokens(), media_type="text/plain", headers=headers)
+    answer = await asyncio.to_thread(lambda: "".join(tokens()))
+    return {"generation": generation, "answer": answer, "chunks": [serialize(chunk) for chunk in results]}
+
+
+@app.get("/scopes")
+async def scopes():
+    # Folder and file type choices for scoped queries, from the sync manifest.
+    return await asyncio.to_thread(scope_options)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "query_cache": cache.stats(),
+        "embedding_batches": batcher.batches,
+        "embedded_queries": batcher.queries,
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    set_gauge("index_generation", cache.generation or 0)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
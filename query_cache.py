@@ -0,0 +1,123 @@
+import os, hashlib, json, re, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from metrics import incr
+
+load_dotenv()
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))  # seconds
+
+
+def normalize_question(text: str) -> str:
+    # "What is PO-5531?" and "what is  po-5531" are the same question.
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+def history_digest(history: Sequence[Tuple[str, str]]) -> str:
+    # Short fingerprint of the [(message, role)] turns a prompt was built from;
+    # "" for a first question, so those share cache entries across sessions.
+    if not history:
+        return ""
+    payload = json.dumps([list(turn) for turn in history], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TTLCache:
+    # Thread-safe in-memory LRU with a per-entry time to live. `name` labels
+    # its hit/miss counters in metrics.
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL,
+                 name: str = "query"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                incr("cache_misses_total", cache=self.name)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            incr("cache_hits_total", cache=self.name)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class QueryCache:
+    # Two levels in front of the query path:
+    #   embeddings  normalized question -> query embedding
+    #   answers     (normalized question, retrieved chunk IDs, history digest) -> answer
+    # Answers are dropped whenever the index generation changes. Query
+    # embeddings only depend on the text and the model, so they survive a
+    # reindex; a repeat question after one costs retrieval plus one LLM call.
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL):
+        self.embeddings = TTLCache(max_entries, ttl, name="query_embedding")
+        self.answers = TTLCache(max_entries, ttl, name="answer")
+        self.generation = None
+        self._lock = threading.Lock()
+
+    def sync_generation(self, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                if self.generation is not None:
+                    print(f"[🧊 Query Cache] Index generation {self.generation} → {generation}, dropping answers")
+                self.answers.clear()
+                self.generation = generation
+
+    def embed(self, question: str, embed_query: Callable[[str], List[float]]) -> List[float]:
+        # The normalized text is only the cache key; the model sees the question
+        # as asked.
+        key = normalize_question(question)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = embed_query(question)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def answer_key(self, question: str, chunk_ids: List[str], *extra: Hashable,
+                   history: Sequence[Tuple[str, str]] = ()) -> tuple:
+        # A follow-up ("and for last year?") means something else in another
+        # conversation, so the history the prompt is built from is part of the key.
+        return (normalize_question(question), tuple(chunk_ids), history_digest(history)) + extra
+
+    def get_answer(self, key: tuple) -> Optional[str]:
+        return self.answers.get(key)
+
+    def put_answer(self, key: tuple, answer: str):
+        self.answers.put(key, answer)
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "embeddings": len(self.embeddings),
+            "embedding_hits": self.embeddings.hits,
+            "embedding_misses": self.embeddings.misses,
+            "answers": len(self.answers),
+            "answer_hits": self.answers.hits,
+            "answer_misses": self.answers.misses,
+        }
@@ -0,0 +1,287 @@
+import os, math, re, sqlite3, threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from metrics import span
+
+load_dotenv()
+
+BM25_DIR = os.getenv("BM25_DIR", "bm25_index")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))                  # chunks handed to the LLM
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))  # per retriever, before fusion
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.65"))
+LEXICAL_COVERAGE_THRESHOLD = float(os.getenv("LEXICAL_COVERAGE_THRESHOLD", "0.5"))
+SCOPED_LEXICAL_OVERSAMPLE = int(os.getenv("SCOPED_LEXICAL_OVERSAMPLE", "10"))  # BM25 has no metadata filter
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "give", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "show", "tell", "that", "the", "this",
+    "to", "was", "we", "what", "when", "where", "which", "who", "why", "with", "you", "your", "about",
+}
+# Keeps codes like "AB-1234", "v2.1" or "po_5531" together as one token.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        # Also index the parts of a compound so "ab-1234" matches "1234".
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+def build_where(top_folders: Optional[Iterable[str]] = None, folders: Optional[Iterable[str]] = None,
+                file_types: Optional[Iterable[str]] = None, modified_after: Optional[float] = None) -> Optional[dict]:
+    # Chroma `where` clause for a scoped query, over the metadata ingest puts on
+    # every chunk (see create_vectordb.item_metadata). None means unscoped.
+    conditions = []
+    if top_folders:
+        conditions.append({"top_folder": {"$in": list(top_folders)}})
+    if folders:
+        conditions.append({"folder": {"$in": list(folders)}})
+    if file_types:
+        conditions.append({"file_type": {"$in": [t.lower().lstrip(".") for t in file_types]}})
+    if modified_after is not None:
+        conditions.append({"last_modified_ts": {"$gte": int(modified_after)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def bm25_path(collection_name: str) -> str:
+    return os.path.join(BM25_DIR, f"{collection_name}.sqlite3")
+
+
+class BM25Index:
+    # Persistent inverted index in SQLite, one file per Chroma collection so it
+    # follows blue/green generations. Postings are (term, chunk_id, tf); BM25
+    # scoring happens in Python over the postings of the query terms only. The
+    # single `stats` row keeps the document count and total length up to date
+    # so a search never scans `docs`.
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0), doc_count INTEGER NOT NULL, total_length INTEGER NOT NULL
+            );
+            """
+        )
+        # Indexes written before the stats row existed get it computed once.
+        self._conn.execute(
+            "INSERT OR IGNORE INTO stats (id, doc_count, total_length) "
+            "SELECT 0, COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+        )
+        self._conn.commit()
+
+    def _stats(self) -> Tuple[int, int]:
+        return self._conn.execute("SELECT doc_count, total_length FROM stats WHERE id = 0").fetchone()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._stats()[0]
+
+    def add(self, ids: List[str], texts: List[str]):
+        with self._lock:
+            self._delete(ids)
+            added, added_length = 0, 0
+            for chunk_id, text in dict(zip(ids, texts)).items():
+                counts = Counter(tokenize(text or ""))
+                length = sum(counts.values())
+                self._conn.execute("INSERT INTO docs (chunk_id, length) VALUES (?, ?)", (chunk_id, length))
+                self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                                       [(term, chunk_id, tf) for term, tf in counts.items()])
+                added += 1
+                added_length += length
+            self._update_stats(added, added_length)
+            self._conn.commit()
+
+    def _update_stats(self, docs: int, length: int):
+        if docs:
+            self._conn.execute("UPDATE stats SET doc_count = doc_count + ?, total_length = total_length + ? "
+                               "WHERE id = 0", (docs, length))
+
+    def _delete(self, ids: List[str]):
+        ids = list(dict.fromkeys(ids))
+        removed, removed_length = 0, 0
+        # SQLite caps bound parameters, so measure what goes in slices.
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            count, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchone()
+            removed += count
+            removed_length += length
+        rows = [(chunk_id,) for chunk_id in ids]
+        self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", rows)
+        self._update_stats(-removed, -removed_length)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("UPDATE stats SET doc_count = 0, total_length = 0 WHERE id = 0")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def copy_to(self, path: str) -> "BM25Index":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        with self._lock:
+            self._conn.backup(target)
+        target.close()
+        return BM25Index(path)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            total, total_length = self._stats()
+            if not total:
+                return []
+            avg_length = total_length / total
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id "
+                    "WHERE p.term = ?", (term,)
+                ).fetchall()
+                df = len(postings)
+                if not df:
+                    continue
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in postings:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+
+
+class RetrievedChunk(NamedTuple):
+    chunk_id: str
+    doc: Document
+    score: float                    # rerank score used for ordering
+    vector_score: Optional[float]   # relevance score from Chroma, if it was a vector hit
+    lexical_score: float            # BM25 score normalised to the best lexical hit
+    coverage: float                 # share of query terms present in the chunk
+
+
+class HybridRetriever:
+    # Fuses vector and BM25 candidates with reciprocal rank fusion, then applies
+    # a cheap local rerank (query term coverage, exact code matches) before the
+    # top RETRIEVAL_K chunks go to the LLM. A chunk is kept only if it is
+    # semantically close (vector score >= RELEVANCE_THRESHOLD) or a strong
+    # lexical match, which is what rescues exact IDs and names.
+
+    def __init__(self, vectorstore, bm25: BM25Index, k: int = RETRIEVAL_K, candidates: int = RETRIEVAL_CANDIDATES):
+        self.vectorstore = vectorstore
+        self.bm25 = bm25
+        self.k = k
+        self.candidates = candidates
+
+    def _vector_candidates(self, query: str, query_embedding: Optional[List[float]], where: Optional[dict] = None):
+        # Chroma applies `where` before the ANN search, so a scoped query only
+        # ranks chunks inside the scope.
+        if query_embedding is None:
+            return self.vectorstore.similarity_search_with_relevance_scores(query, k=self.candidates, filter=where)
+        # The by-vector variant returns raw distances; map them onto the same
+        # 0..1 relevance scale the text variant uses.
+        to_relevance = self.vectorstore._select_relevance_score_fn()
+        hits = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            query_embedding, k=self.candidates, filter=where)
+        return [(doc, to_relevance(distance)) for doc, distance in hits]
+
+    def _fetch(self, ids: List[str], where: Optional[dict] = None) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        result = self.vectorstore.get(ids=ids, where=where, include=["documents", "metadatas"])
+        return {
+            id_: Document(page_content=text, metadata=metadata or {})
+            for id_, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+            if isinstance(text, str)
+        }
+
+    @span("retrieval")
+    def retrieve(self, query: str, query_embedding: Optional[List[float]] = None,
+                 k: Optional[int] = None, where: Optional[dict] = None) -> List[RetrievedChunk]:
+        # `where` (see build_where) restricts both retrievers to a scope.
+        docs: Dict[str, Document] = {}
+        vector_scores: Dict[str, float] = {}
+        fused: Dict[str, float] = {}
+
+        for rank, (doc, score) in enumerate(self._vector_candidates(query, query_embedding, where)):
+            if not doc or not isinstance(doc.page_content, str):
+                continue
+            chunk_id = getattr(doc, "id", None) or doc.metadata.get("chunk_id") or doc.page_content
+            docs[chunk_id] = doc
+            vector_scores[chunk_id] = score
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        # BM25 cannot filter, so a scoped query takes extra lexical hits and
+        # keeps the best ones Chroma confirms are inside the scope.
+        lexical_hits = self.bm25.search(query, self.candidates * (SCOPED_LEXICAL_OVERSAMPLE if where else 1))
+        fetched = self._fetch([chunk_id for chunk_id, _ in lexical_hits if chunk_id not in docs], where)
+        if where:
+            lexical_hits = [hit for hit in lexical_hits if hit[0] in docs or hit[0] in fetched][:self.candidates]
+        docs.update(fetched)
+        best_lexical = lexical_hits[0][1] if lexical_hits else 1.0
+        lexical_scores = {chunk_id: score / best_lexical for chunk_id, score in lexical_hits}
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        query_terms = set(tokenize(query))
+        code_terms = {term for term in query_terms if any(ch.isdigit() for ch in term)}
+        best_fused = max(fused.values(), default=1.0)
+
+        ranked = []
+        for chunk_id, fused_score in fused.items():
+            doc = docs.get(chunk_id)
+            if doc is None:
+                continue
+            chunk_terms = set(tokenize(doc.page_content))
+            coverage = len(query_terms & chunk_terms) / len(query_terms) if query_terms else 0.0
+            exact_codes = 1.0 if code_terms and code_terms <= chunk_terms else 0.0
+            vector_score = vector_scores.get(chunk_id)
+            lexical_score = lexical_scores.get(chunk_id, 0.0)
+
+            relevant = (vector_score is not None and vector_score >= RELEVANCE_THRESHOLD) \
+                or exact_codes or (lexical_score and coverage >= LEXICAL_COVERAGE_THRESHOLD)
+            if not relevant:
+                continue
+            score = 0.5 * fused_score / best_fused + 0.3 * coverage + 0.2 * exact_codes
+            ranked.append(RetrievedChunk(chunk_id, doc, score, vector_score, lexical_score, coverage))
+
+        ranked.sort(key=lambda chunk: chunk.score, reverse=True)
+        return ranked[:k or self.k]
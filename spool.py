@@ -0,0 +1,83 @@
+import os, hashlib, shutil, tempfile, threading, time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(2 * 1024 ** 3)))  # 2 GiB
+SPOOL_STALE_SECONDS = float(os.getenv("SPOOL_STALE_SECONDS", str(24 * 3600)))  # leftovers of crashed runs
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class Spool:
+    # Disk staging area for downloaded files. Downloads reserve their size up
+    # front and block while the spool is over its cap; the consumer releases a
+    # file (deleting it) once it has been loaded. A single file larger than the
+    # cap is still admitted when the spool is empty so it cannot wedge the run.
+    # Each run stages into its own subdirectory of SPOOL_DIR, so concurrent
+    # runs (webhook worker and cron) never delete each other's downloads.
+
+    def __init__(self, directory: str = SPOOL_DIR, max_bytes: int = SPOOL_MAX_BYTES):
+        self.root = directory
+        self.directory = None  # this run's subdirectory, set on __enter__
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._reserved = {}
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._remove_stale()
+        self.directory = tempfile.mkdtemp(prefix="run-", dir=self.root)
+        return self
+
+    def _remove_stale(self):
+        # Entries untouched for SPOOL_STALE_SECONDS belong to a crashed run; a
+        # live run's directory changes with every download it stages.
+        cutoff = time.time() - SPOOL_STALE_SECONDS
+        for entry in os.scandir(self.root):
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # another run got there first
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        with self._cond:
+            self._reserved.clear()
+            self.used_bytes = 0
+            self._cond.notify_all()
+
+    def path_for(self, file_id: str, file_name: str) -> str:
+        ext = os.path.splitext(file_name)[1].lower()
+        return os.path.join(self.directory, f"{file_id}{ext}")
+
+    def reserve(self, path: str, size: int):
+        with self._cond:
+            while self.used_bytes and self.used_bytes + size > self.max_bytes:
+                self._cond.wait()
+            self._reserved[path] = size
+            self.used_bytes += size
+
+    def release(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._cond:
+            self.used_bytes -= self._reserved.pop(path, 0)
+            self._cond.notify_all()
+
+    def write_stream(self, path: str, response) -> str:
+        # Returns the sha256 of the body, computed on the fly.
+        digest = hashlib.sha256()
+        with open(path, "wb") as f:
+            for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                f.write(block)
+                digest.update(block)
+        return digest.hexdigest()
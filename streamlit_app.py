@@ -1,4 +1,4 @@
-### REFRESHES CHROMADB ON EVERY USER QUERY AND LOGS IT ###
+### KEEPS ONE CHROMADB HANDLE PER PROCESS, RELOADED WHEN THE INDEX GENERATION CHANGES ###
 
 __import__('pysqlite3')
 import sys
@@ -6,57 +6,38 @@ sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
 import streamlit as st
 import os
+import time
+import requests
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from openai import OpenAI
-from langchain.prompts import ChatPromptTemplate
+from chromadb.api.client import SharedSystemClient
+from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage
 from datetime import datetime
+from embedding_cache import get_embedding_model
+from index_state import read_index_version, check_index_health, active_collection
+from retrieval import BM25Index, HybridRetriever, bm25_path, build_where
+from query_cache import QueryCache
+from intent import IntentStage
+from generation import SOURCES_MARKER, build_messages, stream_answer
+from sync_manifest import scope_options
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+QUERY_API_URL = os.getenv("QUERY_API_URL")  # set to use query_api.py instead of querying in-process
+QUERY_API_TIMEOUT = float(os.getenv("QUERY_API_TIMEOUT", "120"))
 CHROMA_PATH = "chroma_db"
+RECENCY_WINDOWS = {"Any time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
 
-PROMPT_TEMPLATE = """
-Use the following context to answer the user's question.
-
-Context:
-{context}
-
----
-
-User: {question}
-Assistant:"""
-
-INFO_KEYWORDS = [
-    "what", "how", "explain", "give me", "tell me", "who", "where", "when",
-    "document", "file", "details", "report", "show", "find", "source"
-]
-
-def is_information_query_heuristic(user_input):
-    result = any(kw in user_input.lower() for kw in INFO_KEYWORDS)
-    print(f"[Heuristic] '{user_input}' → Match: {result}")
-    return result
-
-def is_information_query_llm(user_input):
-    prompt = f"""
-Decide if the following user input is asking for information from documents (e.g., question, file search) or just casual/small talk.
-
-Input: "{user_input}"
-Answer only with "yes" or "no".
-"""
-    classifier_llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18", openai_api_key=OPENAI_API_KEY, temperature=0)
-    result = classifier_llm.invoke([HumanMessage(content=prompt)])
-    decision = result.content.strip().lower()
-    print(f"[LLM Intent Classifier] Decision: {decision}")
-    return decision == "yes"
+@st.cache_resource(show_spinner=False)
+def intent_stage():
+    # Trained once per process; decisions are cached across sessions.
+    return IntentStage()
 
 def is_information_query(user_input):
-    return is_information_query_heuristic(user_input) or is_information_query_llm(user_input)
+    return intent_stage().is_information_query(user_input)
 
 def generate_casual_response(user_input):
     casual_prompt = f"""
@@ -69,31 +50,91 @@ Keep it short, friendly, and human-like.
     response = casual_llm.invoke([HumanMessage(content=casual_prompt)])
     return response.content.strip()
 
-def get_fresh_vectorstore():
-    print("[Vectorstore] Reloading ChromaDB client fresh from disk...")
-    embedding = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding)
-
-    try:
-        total_chunks = db._collection.count()
-        all_docs = db._collection.get()
-        print(f"[Vectorstore] Total chunks in Chroma DB: {total_chunks}")
-        print(f"[Vectorstore] Total documents retrieved: {len(all_docs['documents'])}")
-        
-        if any(doc is None for doc in all_docs["documents"]):
-            print("[⚠️ Document Health] Found NoneType page_content — potential broken chunk(s)")
-        else:
-            print("[✅ Document Health] All documents have valid content")
-
-    except Exception as e:
-        print(f"[Vectorstore] Could not fetch chunk count: {e}")
-    
-    # For UI confirmation
-    st.session_state["last_reload_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[🕒 Timestamp] Reloaded at: {st.session_state['last_reload_time']}")
-
-    print("[Vectorstore] Reloaded.")
-    return db
+def generate_answer(user_input, results):
+    # Streams into the current chat message as tokens arrive. The prompt is
+    # assembled within PROMPT_TOKEN_BUDGET, so its size (and the wait for the
+    # first token) does not grow with the conversation.
+    sources = list({chunk.doc.metadata.get("source", "unknown") for chunk in results})
+    history = st.session_state.chat_history[:-1]  # the current question goes in the prompt itself
+    messages = build_messages(user_input, [chunk.doc.page_content for chunk in results], history)
+
+    bot_response = st.write_stream(stream_answer(messages))
+    if sources:
+        formatted_sources = SOURCES_MARKER + "\n" + "\n".join([f"- [{src}]({src})" for src in sources])
+        st.markdown(formatted_sources)
+        bot_response += formatted_sources
+    return bot_response
+
+@st.cache_resource(show_spinner=False)
+def api_session():
+    # One pooled HTTP connection set to the query API for the whole process.
+    return requests.Session()
+
+def remote_answer(user_input):
+    # Thin-client mode: retrieval, caching and generation happen in query_api;
+    # this only streams the answer into the current chat message.
+    history = st.session_state.chat_history[:-1]
+    payload = {"question": user_input, "history": history, "stream": True}
+    if any(st.session_state["scope"].values()):
+        payload["filters"] = st.session_state["scope"]
+    with api_session().post(f"{QUERY_API_URL.rstrip('/')}/answer", json=payload, stream=True,
+                            timeout=QUERY_API_TIMEOUT) as response:
+        response.raise_for_status()
+        print(f"[Query API] Generation {response.headers.get('X-Index-Generation')}, "
+              f"chunks: {response.headers.get('X-Retrieved-Chunks')}")
+        return st.write_stream(response.iter_content(chunk_size=None, decode_unicode=True))
+
+@st.cache_resource(show_spinner=False)
+def loaded_collections():
+    return set()
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_vectorstore(generation: int, collection: str):
+    # Cached per process and keyed by generation: every session shares one
+    # client until create_vectordb bumps the index version. The previous
+    # generation stays cached so queries already running on it can finish.
+    print(f"[Vectorstore] Loading ChromaDB collection {collection} for generation {generation}...")
+    seen = loaded_collections()
+    if collection in seen:
+        # Updated in place: Chroma shares one in-memory system per path within a
+        # process, so drop it to read what the ingest process wrote. A freshly
+        # promoted blue/green collection is read from disk anyway.
+        SharedSystemClient.clear_system_cache()
+    seen.add(collection)
+    embedding = get_embedding_model(cached=False)
+    db = Chroma(collection_name=collection, persist_directory=CHROMA_PATH, embedding_function=embedding)
+    retriever = HybridRetriever(db, BM25Index(bm25_path(collection)))
+    loaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[🕒 Timestamp] Loaded at: {loaded_at}")
+    return db, retriever, loaded_at
+
+@st.cache_resource(show_spinner=False)
+def query_cache():
+    # Shared by every session in the process, like the vector store.
+    return QueryCache()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def scope_choices():
+    # Folders and file types of indexed files; in thin-client mode the
+    # manifest lives next to query_api, so ask it instead.
+    if QUERY_API_URL:
+        response = api_session().get(f"{QUERY_API_URL.rstrip('/')}/scopes", timeout=QUERY_API_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    return scope_options()
+
+def load_current():
+    version = read_index_version()
+    db, retriever, loaded_at = load_vectorstore(version.get("generation", 0), active_collection(version))
+    st.session_state["last_reload_time"] = loaded_at
+    st.session_state["index_version"] = version
+    return db, retriever
+
+def get_vectorstore():
+    return load_current()[0]
+
+def get_retriever():
+    return load_current()[1]
 
 # Initialize session state
 if "chat_history" not in st.session_state:
@@ -103,6 +144,36 @@ if "chat_history" not in st.session_state:
 st.set_page_config(page_title="AI Chat (Docs)", layout="centered")
 st.title("🧠 AI Chat Assistant (SharePoint Docs)")
 
+with st.sidebar:
+    version = read_index_version()
+    st.caption(f"Index generation {version.get('generation', 0)} · updated {version.get('updated_at') or 'never'}")
+    if st.button("Run index health check"):
+        with st.spinner("Scanning vector store..."):
+            health = check_index_health(get_vectorstore()._collection)
+        print(f"[Vectorstore] Health check: {health}")
+        if health["broken_chunks"]:
+            st.warning(f"⚠️ {health['broken_chunks']} of {health['total_chunks']} chunks have empty content")
+        else:
+            st.success(f"✅ All {health['total_chunks']} chunks have valid content")
+
+    # Scoping is applied by Chroma before the vector search, so a narrow scope
+    # is both faster and more precise than searching the whole drive.
+    st.subheader("Search scope")
+    choices = scope_choices()
+    top_folders = st.multiselect("Folders", choices["top_folders"])
+    subfolders = st.multiselect("Subfolders", [
+        folder for folder in choices["folders"]
+        if "/" in folder and (not top_folders or folder.split("/", 1)[0] in top_folders)
+    ])
+    file_types = st.multiselect("File types", choices["file_types"])
+    days = RECENCY_WINDOWS[st.selectbox("Modified", list(RECENCY_WINDOWS))]
+    st.session_state["scope"] = {
+        "top_folders": top_folders,
+        "folders": subfolders,
+        "file_types": file_types,
+        "modified_after": time.time() - days * 86400 if days else None,
+    }
+
 # Display chat history
 for msg, role in st.session_state.chat_history:
     with st.chat_message(role):
@@ -115,67 +186,64 @@ if user_input:
     st.chat_message("user").markdown(user_input)
     st.session_state.chat_history.append((user_input, "user"))
 
+    streamed = False
     if not is_information_query(user_input):
         print("[Intent] Detected casual conversation.")
         bot_response = generate_casual_response(user_input)
+    elif QUERY_API_URL:
+        print("[Intent] Information-seeking query (query API)")
+        with st.chat_message("assistant"):
+            bot_response = remote_answer(user_input)
+        streamed = True
     else:
         print("[Intent] Information-seeking query")
-        db = get_fresh_vectorstore()
+        retriever = get_retriever()
+
+        # Show which index generation answered the query
+        st.info(f"🔄 Index generation `{st.session_state['index_version'].get('generation', 0)}`, "
+                f"loaded at `{st.session_state['last_reload_time']}`")
 
-        # Show last reload time in UI
-        st.info(f"🔄 Vector store reloaded at `{st.session_state['last_reload_time']}`")
+        cache = query_cache()
+        cache.sync_generation(st.session_state["index_version"].get("generation", 0))
 
         with st.status("🔍 Searching the vector store...", expanded=False):
             try:
-                raw_results = db.similarity_search_with_relevance_scores(user_input, k=2)
-                results = []
-                for doc, score in raw_results:
-                    if not doc or not isinstance(doc.page_content, str):
-                        print(f"[⚠️ Skipping invalid doc] {doc}")
-                        continue
-                    results.append((doc, score))
-
-                print("[Vectorstore Results]")
-                for doc, score in results:
-                    excerpt = doc.page_content[:80].replace("\n", " ") if doc.page_content else "<Empty>"
-                    print(f"  - Score: {score:.2f}, Excerpt: {excerpt}...")
+                # Vector + BM25 candidates, fused and reranked; only chunks that
+                # pass the relevance gate come back.
+                query_embedding = cache.embed(user_input, retriever.vectorstore.embeddings.embed_query)
+                where = build_where(**st.session_state["scope"])
+                if where:
+                    print(f"[Scope] {where}")
+                results = retriever.retrieve(user_input, query_embedding=query_embedding, where=where)
+
+                print("[Hybrid Retrieval Results]")
+                for chunk in results:
+                    excerpt = chunk.doc.page_content[:80].replace("\n", " ") if chunk.doc.page_content else "<Empty>"
+                    vector_score = f"{chunk.vector_score:.2f}" if chunk.vector_score is not None else "-"
+                    print(f"  - Score: {chunk.score:.2f} (vector {vector_score}, lexical {chunk.lexical_score:.2f}, "
+                          f"coverage {chunk.coverage:.2f}), Excerpt: {excerpt}...")
             except Exception as e:
                 print(f"[❌ Vectorstore Error] {e}")
                 results = []
 
-        if not results or results[0][1] < 0.65:
+        if not results:
             print("[Relevance] No sufficiently relevant results.")
             bot_response = "❌ I couldn't find relevant information for that."
         else:
-            context = "\n\n---\n\n".join([doc.page_content for doc, _ in results])
-            sources = list({doc.metadata.get("source", "unknown") for doc, _ in results})
-            prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE).format(
-                context=context, question=user_input
-            )
-
-            messages = [{"role": role, "content": msg} for msg, role in st.session_state.chat_history]
-            messages.append({"role": "user", "content": prompt})
-
-            with st.status("🤖 Generating response...", expanded=False) as status:
-                if LLM_PROVIDER == "openrouter":
-                    print("[LLM] Using OpenRouter")
-                    client = OpenAI(api_key=OPENROUTER_API_KEY, base_url="https://openrouter.ai/api/v1")
-                    response = client.chat.completions.create(
-                        model="openai/gpt-4o-mini",
-                        messages=messages
-                    )
-                    bot_response = response.choices[0].message.content
-                else:
-                    print("[LLM] Using OpenAI")
-                    llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, model="gpt-4o-mini-2024-07-18", temperature=0)
-                    bot_response = llm.invoke(messages).content
-
-                if sources:
-                    formatted_sources = "\n\n📎 **Sources:**\n" + "\n".join([f"- [{src}]({src})" for src in sources])
-                    bot_response += formatted_sources
-
-                status.update(label="✅ Done", state="complete")
-
-    with st.chat_message("assistant"):
-        st.markdown(bot_response)
+            # Same question over the same chunks (and provider) after the same
+            # conversation gives the same answer.
+            answer_key = cache.answer_key(user_input, [chunk.chunk_id for chunk in results], LLM_PROVIDER,
+                                          history=st.session_state.chat_history[:-1])
+            bot_response = cache.get_answer(answer_key)
+            if bot_response is not None:
+                print(f"[🧊 Query Cache] Answer hit {cache.stats()}")
+            else:
+                with st.chat_message("assistant"):
+                    bot_response = generate_answer(user_input, results)
+                streamed = True
+                cache.put_answer(answer_key, bot_response)
+
+    if not streamed:
+        with st.chat_message("assistant"):
+            st.markdown(bot_response)
     st.session_state.chat_history.append((bot_response, "assistant"))
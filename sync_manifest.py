@@ -0,0 +1,266 @@
+import os, json, sqlite3, threading, time
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SYNC_MANIFEST_PATH = os.getenv("SYNC_MANIFEST_PATH", "sync_manifest.sqlite3")
+LEGACY_PROCESSED_FILE = "processed_files.json"
+LEGACY_DELTA_TOKEN_FILE = "delta_token.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id       TEXT PRIMARY KEY,
+    name          TEXT,
+    path          TEXT,
+    web_url       TEXT,
+    etag          TEXT,
+    ctag          TEXT,
+    last_modified TEXT,
+    size          INTEGER,
+    content_hash  TEXT,
+    chunk_ids     TEXT,
+    chunk_count   INTEGER NOT NULL DEFAULT 0,
+    parse_seconds REAL,
+    status        TEXT NOT NULL,
+    last_error    TEXT,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE TABLE IF NOT EXISTS folders (
+    folder_id TEXT PRIMARY KEY,
+    path      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# status values:
+#   pending      listed as new/changed, not yet indexed; a crash or a failed
+#                download leaves it here and the next run retries it
+#   indexed      chunks written; chunk_ids lists them (NULL for rows imported
+#                from processed_files.json, whose chunks were never listed)
+#   empty        loaded but produced no chunks
+#   failed       parse error or timeout; retried only once the file changes
+#   unsupported  extension we do not load
+
+
+class SyncManifest:
+    # Per-file sync state in SQLite. Lookups are primary-key hits, so skip
+    # decisions stay O(1) per file however large the drive is. Each change
+    # commits on its own unless `deferred` is set, in which case nothing is
+    # visible until flush(): blue/green runs use that to publish the manifest
+    # in the same step as the collection it describes.
+
+    def __init__(self, path: str = SYNC_MANIFEST_PATH, deferred: bool = False):
+        self.deferred = deferred
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._conn.commit()
+        self._migrate_legacy()
+
+    def _add_missing_columns(self):
+        # Manifests created before a column existed get it added in place.
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "path" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN path TEXT")
+
+    def _migrate_legacy(self):
+        # One-time import of processed_files.json / delta_token.json.
+        if self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone():
+            return
+        now = time.time()
+        if os.path.exists(LEGACY_PROCESSED_FILE):
+            with open(LEGACY_PROCESSED_FILE, "r") as f:
+                legacy = json.load(f)
+            # chunk_ids stays NULL: these files have chunks in Chroma, but which
+            # ones is unknown (see may_have_chunks).
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO files (file_id, last_modified, status, updated_at) VALUES (?, ?, 'indexed', ?)",
+                [(file_id, last_modified, now) for file_id, last_modified in legacy.items()],
+            )
+            print(f"[🗂️ Manifest] Imported {len(legacy)} file(s) from {LEGACY_PROCESSED_FILE}")
+        if os.path.exists(LEGACY_DELTA_TOKEN_FILE) and self.get_state("delta_link") is None:
+            with open(LEGACY_DELTA_TOKEN_FILE, "r") as f:
+                delta_link = json.load(f).get("deltaLink")
+            if delta_link:
+                self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('delta_link', ?)", (delta_link,))
+        self._conn.commit()
+
+    def _commit(self):
+        if not self.deferred:
+            self._conn.commit()
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, file_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+
+    def is_current(self, item: dict) -> bool:
+        row = self.get(item["id"])
+        if row is None or row["status"] == "pending":
+            return False
+        if row["last_modified"] == item.get("lastModifiedDateTime"):
+            return True
+        # Same content and URL: only properties like sharing changed.
+        ctag = item.get("cTag")
+        return bool(ctag) and row["ctag"] == ctag and row["web_url"] == item.get("webUrl")
+
+    def path_changed(self, item: dict) -> bool:
+        # Moved or renamed (itself or a folder above it) since it was indexed.
+        # An unresolved path (None) never counts as a change.
+        row = self.get(item["id"])
+        return row is not None and item.get("path") is not None and row["path"] != item["path"]
+
+    def file_ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT file_id FROM files")}
+
+    def file_ids_with_status(self, status: str) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT file_id FROM files WHERE status = ?", (status,))}
+
+    def known(self, file_ids: Iterable[str]) -> set:
+        return set(file_ids) & self.file_ids()
+
+    def may_have_chunks(self, file_id: str) -> bool:
+        # True unless the manifest knows the file has nothing stored. A NULL
+        # chunk_ids (legacy import) counts as "may have chunks".
+        row = self.get(file_id)
+        return row is not None and (row["chunk_ids"] is None or bool(row["chunk_count"]))
+
+    def _upsert(self, item: dict, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO files (file_id, name, path, web_url, etag, ctag, last_modified, size, status, last_error,
+                                      updated_at, chunk_ids)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '[]')
+                   ON CONFLICT(file_id) DO UPDATE SET
+                       name = excluded.name, path = COALESCE(excluded.path, path), web_url = excluded.web_url,
+                       etag = excluded.etag,
+                       ctag = excluded.ctag, last_modified = excluded.last_modified, size = excluded.size,
+                       status = excluded.status, last_error = excluded.last_error, updated_at = excluded.updated_at""",
+                (item["id"], item.get("name"), item.get("path"), item.get("webUrl"), item.get("eTag"), item.get("cTag"),
+                 item.get("lastModifiedDateTime"), item.get("size"), status, error, time.time()),
+            )
+            self._commit()
+
+    def mark_pending(self, item: dict):
+        self._upsert(item, "pending")
+
+    def mark_unsupported(self, item: dict):
+        self._upsert(item, "unsupported")
+
+    def record_result(self, file_id: str, status: str, content_hash: Optional[str] = None,
+                      chunk_ids: Optional[List[str]] = None, parse_seconds: Optional[float] = None,
+                      error: Optional[str] = None):
+        chunk_ids = chunk_ids or []
+        with self._lock:
+            self._conn.execute(
+                """UPDATE files SET status = ?, content_hash = COALESCE(?, content_hash), chunk_ids = ?,
+                       chunk_count = ?, parse_seconds = ?, last_error = ?, updated_at = ?
+                   WHERE file_id = ?""",
+                (status, content_hash, json.dumps(chunk_ids), len(chunk_ids), parse_seconds, error,
+                 time.time(), file_id),
+            )
+            self._commit()
+
+    def delete(self, file_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE file_id = ?", [(file_id,) for file_id in file_ids])
+            self._commit()
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: Optional[str]):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+            self._commit()
+
+    def set_path(self, file_id: str, path: str, web_url: Optional[str] = None):
+        with self._lock:
+            self._conn.execute("UPDATE files SET path = ?, web_url = COALESCE(?, web_url) WHERE file_id = ?",
+                               (path, web_url, file_id))
+            self._commit()
+
+    def folder_moves(self, folder_paths: Dict[str, str]) -> Dict[str, str]:
+        # {file id: new path} for the files under every folder in `folder_paths`
+        # whose path differs from the one stored by set_folder_paths. A delta
+        # reports a renamed or moved folder, but not the files inside it.
+        moved = {}
+        with self._lock:
+            for folder_id, new in folder_paths.items():
+                row = self._conn.execute("SELECT path FROM folders WHERE folder_id = ?", (folder_id,)).fetchone()
+                if row is None or not row[0] or row[0] == new:
+                    continue
+                prefix = row[0] + "/"
+                for file_id, path in self._conn.execute(
+                        "SELECT file_id, path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)):
+                    moved[file_id] = f"{new}/{path[len(prefix):]}"
+        return moved
+
+    def set_folder_paths(self, folder_paths: Dict[str, str]):
+        # Stores {folder id: path}; subfolders of a moved folder follow it even
+        # when the delta does not list them.
+        with self._lock:
+            for folder_id, new in folder_paths.items():
+                row = self._conn.execute("SELECT path FROM folders WHERE folder_id = ?", (folder_id,)).fetchone()
+                if row is not None and row[0] and row[0] != new:
+                    prefix = row[0] + "/"
+                    self._conn.execute(
+                        "UPDATE folders SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+                        (new + "/", len(prefix) + 1, len(prefix), prefix),
+                    )
+                self._conn.execute("INSERT OR REPLACE INTO folders (folder_id, path) VALUES (?, ?)", (folder_id, new))
+            self._commit()
+
+    def status_counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+
+def scope_options(path: str = SYNC_MANIFEST_PATH) -> dict:
+    # Folders and file types of indexed files, for query scoping controls.
+    # Opened read-only so the query side never writes to the ingest manifest.
+    options = {"top_folders": [], "folders": [], "file_types": []}
+    if not os.path.exists(path):
+        return options
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT path, name FROM files WHERE status = 'indexed'").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return options  # no path column yet: written by an older version
+    folders, file_types = set(), set()
+    for file_path, name in rows:
+        if file_path and "/" in file_path:
+            folders.add(file_path.rsplit("/", 1)[0])
+        extension = os.path.splitext(name or "")[1].lower().lstrip(".")
+        if extension:
+            file_types.add(extension)
+    options["folders"] = sorted(folders)
+    options["top_folders"] = sorted({folder.split("/", 1)[0] for folder in folders})
+    options["file_types"] = sorted(file_types)
+    return options
+
@@ -0,0 +1,137 @@
+import os, json, threading, time, traceback
+from typing import Callable, List, Optional
+
+QUEUE_STATE_FILE = "sync_queue.json"
+RETRY_DELAY = float(os.getenv("SYNC_RETRY_DELAY", "30"))  # seconds after a failed run
+MAX_QUEUED_NOTIFICATIONS = int(os.getenv("SYNC_QUEUE_MAX_NOTIFICATIONS", "1000"))
+
+
+def _as_list(value) -> List[dict]:
+    if isinstance(value, list):
+        return value
+    return [{} for _ in range(value or 0)]
+
+
+class CoalescingQueue:
+    # Single-worker sync queue. Notifications arriving while a run is in
+    # progress are merged into one pending follow-up run instead of being
+    # dropped, so every edit is indexed by at most one run after the current
+    # one. Pending work is persisted so a restart (or a crash mid-run) still
+    # performs the follow-up. The handler receives the coalesced notification
+    # payloads; past MAX_QUEUED_NOTIFICATIONS only an empty {} is kept, which
+    # handlers treat as "resolve the changes yourself".
+
+    def __init__(self, handler: Callable[[List[dict]], None], state_file: str = QUEUE_STATE_FILE):
+        self.handler = handler
+        self.state_file = state_file
+        self._cond = threading.Condition()
+
+        self.pending = []           # notifications merged into the next run
+        self.first_pending_at = None
+        self.in_flight = []         # notifications covered by the running sync
+        self.in_flight_since = None  # when the oldest of them arrived
+        self.running_since = None
+        self.runs = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_lag = None        # oldest notification -> end of the run that indexed it
+        self.last_error = None
+        self._load()
+
+        self._worker = threading.Thread(target=self._loop, name="sync-queue", daemon=True)
+        self._worker.start()
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not read {self.state_file}: {e}")
+            return
+        # A run that was in flight when the process died never finished.
+        # Older state files stored counts rather than payloads.
+        self.pending = self._merge(_as_list(state.get("pending")), _as_list(state.get("in_flight")))
+        arrived = [state.get("first_pending_at"), state.get("in_flight_since")]
+        self.first_pending_at = min(filter(None, arrived), default=None) if self.pending else None
+        if self.pending:
+            print(f"📥 Restored {len(self.pending)} pending notification(s) from {self.state_file}")
+
+    def _persist(self):
+        state = {"pending": self.pending, "first_pending_at": self.first_pending_at, "in_flight": self.in_flight,
+                 "in_flight_since": self.in_flight_since}
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+
+    @staticmethod
+    def _merge(pending: List[dict], notifications: List[dict]) -> List[dict]:
+        merged = pending + notifications
+        return merged if len(merged) <= MAX_QUEUED_NOTIFICATIONS else [{}]
+
+    def enqueue(self, notifications: List[dict], received_at: Optional[float] = None):
+        with self._cond:
+            self.pending = self._merge(self.pending, notifications or [{}])
+            if self.first_pending_at is None:
+                self.first_pending_at = received_at or time.time()
+            self._persist()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+                self.in_flight, self.in_flight_since = self.pending, self.first_pending_at
+                self.pending, self.first_pending_at = [], None
+                oldest = self.in_flight_since
+                self.running_since = time.time()
+                self._persist()
+
+            print(f"🚀 Sync run starting for {len(self.in_flight)} coalesced notification(s)")
+            error = None
+            try:
+                self.handler(self.in_flight)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+
+            with self._cond:
+                finished = time.time()
+                self.last_duration = finished - self.running_since
+                self.runs += 1
+                if error:
+                    # Put the batch back, keeping its original age, and retry later.
+                    self.failures += 1
+                    self.last_error = error
+                    self.pending = self._merge(self.in_flight, self.pending)
+                    self.first_pending_at = min(filter(None, [oldest, self.first_pending_at]), default=oldest)
+                    print(f"❌ Sync run failed after {self.last_duration:.2f}s, retrying in {RETRY_DELAY:.0f}s: {error}")
+                else:
+                    self.last_error = None
+                    self.last_lag = finished - oldest if oldest else None
+                    print(f"✅ Sync run completed in {self.last_duration:.2f}s")
+                self.in_flight, self.in_flight_since = [], None
+                self.running_since = None
+                self._persist()
+
+            if error:
+                time.sleep(RETRY_DELAY)
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.time()
+            return {
+                "depth": len(self.pending),
+                "lag_seconds": round(now - self.first_pending_at, 3) if self.first_pending_at else 0.0,
+                "running": self.running_since is not None,
+                "running_for_seconds": round(now - self.running_since, 3) if self.running_since else 0.0,
+                "in_flight": len(self.in_flight),
+                "runs": self.runs,
+                "failures": self.failures,
+                "last_duration_seconds": self.last_duration,
+                "last_lag_seconds": self.last_lag,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,173 @@
+import threading, unittest
+from unittest import mock
+from langchain_core.documents import Document
+import embedding_scheduler
+from embedding_cache import FakeEmbeddings
+from embedding_scheduler import AdaptiveLimiter, EmbeddingScheduler, pack_batches
+
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+
+class RateLimitedError(Exception):
+    status_code = 429
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    # FakeEmbeddings whose first `failures` calls fail with `error`.
+
+    def __init__(self, failures: int, error: Exception = None):
+        super().__init__(dim=16)
+        self.failures = failures
+        self.error = error or RateLimitedError("429 Too Many Requests")
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise self.error
+        return super().embed_documents(texts)
+
+
+def make_chunks(sizes):
+    # One chunk per size, `size` words long, so token counts are exact under word_count.
+    ids = [f"file:{i}:hash" for i in range(len(sizes))]
+    chunks = [Document(page_content=" ".join(f"w{i}x{j}" for j in range(size)), metadata={"i": i})
+              for i, size in enumerate(sizes)]
+    return ids, chunks
+
+
+@mock.patch.object(embedding_scheduler, "count_tokens", word_count)
+class PackBatchesTest(unittest.TestCase):
+    def test_fills_batches_up_to_token_budget(self):
+        ids, chunks = make_chunks([4, 4, 4, 4, 4])
+        batches = pack_batches(ids, chunks, max_tokens=10, max_inputs=100)
+        self.assertEqual([[id_ for id_, _, _ in batch] for batch in batches],
+                         [ids[0:2], ids[2:4], ids[4:5]])
+        self.assertEqual([sum(tokens for _, _, tokens in batch) for batch in batches], [8, 8, 4])
+
+    def test_caps_inputs_per_batch(self):
+        ids, chunks = make_chunks([1] * 7)
+        batches = pack_batches(ids, chunks, max_tokens=1000, max_inputs=3)
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+
+    def test_oversized_chunk_gets_its_own_batch(self):
+        ids, chunks = make_chunks([2, 50, 2])
+        batches = pack_batches(ids, chunks, max_tokens=10, max_inputs=100)
+        self.assertEqual([[id_ for id_, _, _ in batch] for batch in batches], [[ids[0]], [ids[1]], [ids[2]]])
+
+    def test_keeps_order_and_pairs_ids_with_chunks(self):
+        ids, chunks = make_chunks([3, 1, 4, 1, 5, 9, 2, 6])
+        batches = pack_batches(ids, chunks, max_tokens=8, max_inputs=100)
+        flat = [(id_, chunk) for batch in batches for id_, chunk, _ in batch]
+        self.assertEqual(flat, list(zip(ids, chunks)))
+
+    def test_empty_input(self):
+        self.assertEqual(pack_batches([], []), [])
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_rate_limit_halves_down_to_one(self):
+        limiter = AdaptiveLimiter(8)
+        limits = []
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(rate_limited=True)
+            limits.append(limiter.limit)
+        self.assertEqual(limits, [4, 2, 1, 1, 1])
+
+    def test_successes_grow_limit_back_one_at_a_time(self):
+        limiter = AdaptiveLimiter(4)
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(rate_limited=True)
+        self.assertEqual(limiter.limit, 1)
+        limits = []
+        for _ in range(1 + 2 + 3 + 2):
+            limiter.acquire()
+            limiter.release(rate_limited=False)
+            limits.append(limiter.limit)
+        # Growing from `limit` takes `limit` consecutive successes; capped at max_concurrency.
+        self.assertEqual(limits, [2, 2, 3, 3, 3, 4, 4, 4])
+
+    def test_rate_limit_resets_success_streak(self):
+        limiter = AdaptiveLimiter(4)
+        limiter.acquire()
+        limiter.release(rate_limited=True)  # 4 -> 2
+        limiter.acquire()
+        limiter.release(rate_limited=False)
+        limiter.acquire()
+        limiter.release(rate_limited=True)  # 2 -> 1, streak lost
+        limiter.acquire()
+        limiter.release(rate_limited=False)  # 1 success at limit 1 -> 2
+        self.assertEqual(limiter.limit, 2)
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveLimiter(1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def second():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=second, daemon=True)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release(rate_limited=False)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+
+@mock.patch.object(embedding_scheduler, "count_tokens", word_count)
+@mock.patch.object(embedding_scheduler.time, "sleep", lambda seconds: None)
+class EmbeddingSchedulerTest(unittest.TestCase):
+    def run_scheduler(self, embeddings, sizes, **kwargs):
+        ids, chunks = make_chunks(sizes)
+        scheduler = EmbeddingScheduler(embeddings, **kwargs)
+        written = []
+        batches = scheduler.run(ids, chunks, lambda *batch: written.append(batch))
+        return scheduler, ids, chunks, written, batches
+
+    def test_writes_every_batch_once_with_matching_vectors(self):
+        embeddings = FlakyEmbeddings(failures=0)
+        scheduler, ids, chunks, written, batches = self.run_scheduler(
+            embeddings, [4] * 10, max_batch_tokens=8, max_batch_inputs=100, max_concurrency=3)
+        self.assertEqual(batches, 5)
+        self.assertEqual(len(written), 5)
+        self.assertEqual(sorted(id_ for batch_ids, _, _ in written for id_ in batch_ids), sorted(ids))
+        for batch_ids, batch_chunks, vectors in written:
+            self.assertEqual(len(batch_ids), len(batch_chunks))
+            self.assertEqual(vectors, FakeEmbeddings(dim=16).embed_documents([c.page_content for c in batch_chunks]))
+        self.assertEqual(scheduler.tokens, 40)
+        self.assertEqual(scheduler.rate_limited, 0)
+
+    def test_retries_injected_429s_and_halves_concurrency(self):
+        embeddings = FlakyEmbeddings(failures=2)
+        scheduler, ids, _, written, batches = self.run_scheduler(
+            embeddings, [4] * 4, max_batch_tokens=4, max_batch_inputs=100, max_concurrency=4, max_retries=3)
+        self.assertEqual(batches, 4)
+        self.assertEqual(sorted(id_ for batch_ids, _, _ in written for id_ in batch_ids), sorted(ids))
+        self.assertEqual(scheduler.rate_limited, 2)
+        self.assertEqual(embeddings.calls, 4 + 2)
+        # Two halvings (4 -> 2 -> 1), then the successes alone cannot climb back to 4.
+        self.assertLess(scheduler.limiter.limit, 4)
+
+    def test_gives_up_after_max_retries(self):
+        embeddings = FlakyEmbeddings(failures=100)
+        with self.assertRaises(RateLimitedError):
+            self.run_scheduler(embeddings, [4], max_retries=2, max_concurrency=1)
+        self.assertEqual(embeddings.calls, 3)
+
+    def test_other_errors_are_not_retried(self):
+        embeddings = FlakyEmbeddings(failures=1, error=ValueError("bad input"))
+        with self.assertRaises(ValueError):
+            self.run_scheduler(embeddings, [4], max_retries=5, max_concurrency=1)
+        self.assertEqual(embeddings.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json, os, shutil, tempfile, unittest
+from sync_manifest import LEGACY_PROCESSED_FILE, SyncManifest
+
+
+def drive_item(file_id: str, name: str = "report.txt", modified: str = "2024-05-01T09:30:00Z", **extra) -> dict:
+    return {"id": file_id, "name": name, "lastModifiedDateTime": modified, "cTag": f'"{file_id}-1"',
+            "webUrl": f"https://example.sharepoint.com/{name}", **extra}
+
+
+class ManifestTestCase(unittest.TestCase):
+    # Each test runs in its own directory, since the legacy files are read from the cwd.
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def open_manifest(self) -> SyncManifest:
+        manifest = SyncManifest(os.path.join(self.dir, "manifest.sqlite3"))
+        self.addCleanup(manifest.close)
+        return manifest
+
+
+class LegacyMigrationTest(ManifestTestCase):
+    def test_imported_files_may_have_chunks(self):
+        with open(LEGACY_PROCESSED_FILE, "w") as f:
+            json.dump({"legacy-1": "2024-05-01T09:30:00Z"}, f)
+        manifest = self.open_manifest()
+        row = manifest.get("legacy-1")
+        self.assertEqual(row["status"], "indexed")
+        self.assertIsNone(row["chunk_ids"])
+        # Renamed to an unsupported type, or re-parsed to nothing: its chunks
+        # have to be looked up in Chroma and removed.
+        self.assertTrue(manifest.may_have_chunks("legacy-1"))
+
+    def test_imported_file_known_empty_after_result(self):
+        with open(LEGACY_PROCESSED_FILE, "w") as f:
+            json.dump({"legacy-1": "2024-05-01T09:30:00Z"}, f)
+        manifest = self.open_manifest()
+        manifest.mark_pending(drive_item("legacy-1", "report.xyz"))
+        self.assertTrue(manifest.may_have_chunks("legacy-1"))  # still unknown until its chunks are gone
+        manifest.record_result("legacy-1", "unsupported")
+        self.assertFalse(manifest.may_have_chunks("legacy-1"))
+
+
+class ChunkTrackingTest(ManifestTestCase):
+    def test_new_file_has_no_chunks(self):
+        manifest = self.open_manifest()
+        manifest.mark_pending(drive_item("f1"))
+        self.assertFalse(manifest.may_have_chunks("f1"))
+        self.assertFalse(manifest.may_have_chunks("never-seen"))
+
+    def test_indexed_then_empty(self):
+        manifest = self.open_manifest()
+        manifest.mark_pending(drive_item("f1"))
+        manifest.record_result("f1", "indexed", "hash", ["f1:0:aa", "f1:1:bb"], 0.1)
+        self.assertTrue(manifest.may_have_chunks("f1"))
+        self.assertEqual(manifest.get("f1")["chunk_count"], 2)
+        manifest.record_result("f1", "empty", "hash2", [], 0.1)
+        self.assertFalse(manifest.may_have_chunks("f1"))
+
+
+class PathTrackingTest(ManifestTestCase):
+    def indexed(self, manifest, file_id: str, path: str, name: str = "report.txt"):
+        manifest.mark_pending(drive_item(file_id, name, path=path))
+        manifest.record_result(file_id, "indexed", "hash", [f"{file_id}:0:aa"], 0.1)
+
+    def test_moved_file_is_current_but_path_changed(self):
+        manifest = self.open_manifest()
+        self.indexed(manifest, "f1", "HR/report.txt")
+        moved = drive_item("f1", path="Finance/report.txt")
+        # Same content: no download, but its chunks need the new path.
+        self.assertTrue(manifest.is_current(moved))
+        self.assertTrue(manifest.path_changed(moved))
+        self.assertFalse(manifest.path_changed(drive_item("f1", path="HR/report.txt")))
+        self.assertFalse(manifest.path_changed(drive_item("f1", path=None)))  # unresolved folder
+        manifest.set_path("f1", "Finance/report.txt")
+        self.assertFalse(manifest.path_changed(moved))
+
+    def test_renamed_folder_moves_files_below_it(self):
+        manifest = self.open_manifest()
+        manifest.set_folder_paths({"root": "", "hr": "HR", "policies": "HR/Policies", "it": "IT"})
+        self.indexed(manifest, "f1", "HR/report.txt")
+        self.indexed(manifest, "f2", "HR/Policies/handbook.pdf", "handbook.pdf")
+        self.indexed(manifest, "f3", "HRX/other.txt", "other.txt")
+        self.indexed(manifest, "f4", "IT/setup.txt", "setup.txt")
+
+        # A delta for the rename lists the folder (and its ancestors), not the files.
+        folder_paths = {"root": "", "hr": "People"}
+        self.assertEqual(manifest.folder_moves(folder_paths),
+                         {"f1": "People/report.txt", "f2": "People/Policies/handbook.pdf"})
+        manifest.set_folder_paths(folder_paths)
+        self.assertEqual(manifest.folder_moves(folder_paths), {})
+
+        # The subfolder followed its parent, so a later delta listing it is not a move.
+        manifest.set_path("f1", "People/report.txt")
+        manifest.set_path("f2", "People/Policies/handbook.pdf")
+        self.assertEqual(manifest.folder_moves({"policies": "People/Policies"}), {})
+        self.assertEqual(manifest.folder_moves({"policies": "Archive/Policies"}),
+                         {"f2": "Archive/Policies/handbook.pdf"})
+
+    def test_unknown_folder_is_not_a_move(self):
+        manifest = self.open_manifest()
+        self.indexed(manifest, "f1", "HR/report.txt")
+        self.assertEqual(manifest.folder_moves({"hr": "People"}), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import json, os, shutil, tempfile, threading, time, unittest
+from unittest import mock
+import sync_queue
+from sync_queue import CoalescingQueue
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the sync worker")
+        time.sleep(0.01)
+
+
+class ControlledHandler:
+    # Records each run's notifications and blocks it until release() is called;
+    # runs listed in `fail_runs` (1-based) raise once released.
+
+    def __init__(self, fail_runs=()):
+        self.fail_runs = set(fail_runs)
+        self.batches = []
+        self._releases = threading.Semaphore(0)
+
+    def __call__(self, notifications):
+        self.batches.append(list(notifications))
+        run = len(self.batches)
+        self._releases.acquire()
+        if run in self.fail_runs:
+            raise RuntimeError(f"run {run} failed")
+
+    def release(self, runs: int = 1):
+        for _ in range(runs):
+            self._releases.release()
+
+
+class SyncQueueTestCase(unittest.TestCase):
+    # Workers are daemon threads and never exit; each test leaves its own
+    # blocked in the handler or idle, with a state file in its own directory.
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.state_file = os.path.join(self.dir, "sync_queue.json")
+
+    def make_queue(self, handler) -> CoalescingQueue:
+        return CoalescingQueue(handler, state_file=self.state_file)
+
+
+class CoalescingTest(SyncQueueTestCase):
+    def test_notifications_during_a_run_merge_into_one_follow_up(self):
+        handler = ControlledHandler()
+        queue = self.make_queue(handler)
+        queue.enqueue([{"n": 1}])
+        wait_for(lambda: len(handler.batches) == 1)
+
+        queue.enqueue([{"n": 2}])
+        queue.enqueue([{"n": 3}, {"n": 4}])
+        stats = queue.stats()
+        self.assertTrue(stats["running"])
+        self.assertEqual((stats["in_flight"], stats["depth"]), (1, 3))
+
+        handler.release(2)
+        wait_for(lambda: queue.stats()["runs"] == 2)
+        self.assertEqual(handler.batches, [[{"n": 1}], [{"n": 2}, {"n": 3}, {"n": 4}]])
+        self.assertEqual(queue.stats()["depth"], 0)
+
+    def test_empty_enqueue_still_schedules_a_run(self):
+        handler = ControlledHandler()
+        queue = self.make_queue(handler)
+        handler.release()
+        queue.enqueue([])
+        wait_for(lambda: queue.stats()["runs"] == 1)
+        self.assertEqual(handler.batches, [[{}]])
+
+    @mock.patch.object(sync_queue, "MAX_QUEUED_NOTIFICATIONS", 3)
+    def test_collapses_past_the_cap(self):
+        handler = ControlledHandler()
+        queue = self.make_queue(handler)
+        queue.enqueue([{"n": 1}])
+        wait_for(lambda: len(handler.batches) == 1)
+        queue.enqueue([{"n": 2}, {"n": 3}])
+        queue.enqueue([{"n": 4}, {"n": 5}])
+        # Too many to keep: one {} makes the handler resolve the changes itself.
+        self.assertEqual(queue.pending, [{}])
+
+        handler.release(2)
+        wait_for(lambda: queue.stats()["runs"] == 2)
+        self.assertEqual(handler.batches[1], [{}])
+
+
+@mock.patch.object(sync_queue, "RETRY_DELAY", 3600)
+class FailureTest(SyncQueueTestCase):
+    def test_failed_batch_is_restored_with_its_original_age(self):
+        handler = ControlledHandler(fail_runs={1})
+        queue = self.make_queue(handler)
+        queue.enqueue([{"n": 1}], received_at=1000.0)
+        wait_for(lambda: len(handler.batches) == 1)
+        queue.enqueue([{"n": 2}], received_at=2000.0)
+
+        handler.release()
+        wait_for(lambda: queue.stats()["failures"] == 1)
+        # The failed batch goes back in front of what arrived during the run,
+        # and the lag keeps counting from its oldest notification.
+        self.assertEqual(queue.pending, [{"n": 1}, {"n": 2}])
+        self.assertEqual(queue.first_pending_at, 1000.0)
+        self.assertIn("run 1 failed", queue.stats()["last_error"])
+        with open(self.state_file) as f:
+            state = json.load(f)
+        self.assertEqual((state["pending"], state["in_flight"]), ([{"n": 1}, {"n": 2}], []))
+
+
+class RestartTest(SyncQueueTestCase):
+    def test_restores_pending_and_in_flight_after_a_restart(self):
+        # The process dies while a run is in flight, with more queued behind it.
+        handler = ControlledHandler()
+        queue = self.make_queue(handler)
+        queue.enqueue([{"n": 1}], received_at=1000.0)
+        wait_for(lambda: len(handler.batches) == 1)
+        queue.enqueue([{"n": 2}], received_at=2000.0)
+        with open(self.state_file) as f:
+            state = json.load(f)
+        self.assertEqual((state["in_flight"], state["pending"]), ([{"n": 1}], [{"n": 2}]))
+        self.assertEqual((state["in_flight_since"], state["first_pending_at"]), (1000.0, 2000.0))
+
+        restarted = ControlledHandler()
+        queue = self.make_queue(restarted)
+        wait_for(lambda: len(restarted.batches) == 1)
+        self.assertEqual(restarted.batches, [[{"n": 2}, {"n": 1}]])
+        restarted.release()
+        wait_for(lambda: queue.stats()["runs"] == 1)
+        # Measured from the in-flight notification, the oldest one restored.
+        self.assertGreater(queue.stats()["last_lag_seconds"], time.time() - 1001.0)
+
+    def test_reads_counts_from_older_state_files(self):
+        with open(self.state_file, "w") as f:
+            json.dump({"pending": 2, "first_pending_at": 1000.0, "in_flight": 1}, f)
+        handler = ControlledHandler()
+        self.make_queue(handler)
+        wait_for(lambda: len(handler.batches) == 1)
+        self.assertEqual(handler.batches, [[{}, {}, {}]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from transcription import plan_segments, stitch
+
+
+def piece(start: float, end: float, text: str) -> dict:
+    return {"start": start, "end": end, "text": text}
+
+
+class PlanSegmentsTest(unittest.TestCase):
+    def test_overlapping_segments_cover_the_file(self):
+        self.assertEqual(plan_segments(25, segment=10, overlap=2), [(0.0, 12), (10.0, 12), (20.0, 5)])
+
+    def test_short_file_is_one_segment(self):
+        self.assertEqual(plan_segments(7, segment=10, overlap=2), [(0.0, 7)])
+        self.assertEqual(plan_segments(0, segment=10, overlap=2), [])
+
+    def test_no_segment_for_a_tail_inside_the_overlap(self):
+        # The second segment already reaches 20.5s; a (20, 0.5) segment would
+        # lose the words in it to stitch() on both sides.
+        self.assertEqual(plan_segments(20.5, segment=10, overlap=2), [(0.0, 12), (10.0, 10.5)])
+        self.assertEqual(plan_segments(22, segment=10, overlap=2), [(0.0, 12), (10.0, 12)])
+
+
+class StitchTest(unittest.TestCase):
+    def test_overlap_kept_once_and_offsets_applied(self):
+        plan = [(0.0, 12), (10.0, 12), (20.0, 5)]
+        # "early" (10.5s) and "late" (11.2s) fall in the first overlap and are
+        # heard by both segments; "end" (20.6s) in the second.
+        results = [
+            [piece(0, 5, "one"), piece(10.5, 11, "early"), piece(11.2, 11.8, "late")],
+            [piece(0.5, 1, "early"), piece(1.2, 1.8, "late"), piece(3, 5, "two"), piece(10.6, 11, "end")],
+            [piece(0.6, 1, "end"), piece(1.5, 4, "three")],
+        ]
+        stitched = stitch(results, plan, overlap=2)
+        # Each overlap is split at its midpoint (11s and 21s): a word is kept
+        # from the segment it starts in relative to that point.
+        self.assertEqual([p["text"] for p in stitched], ["one", "early", "late", "two", "end", "three"])
+        self.assertEqual([(p["start"], p["segment"]) for p in stitched],
+                         [(0, 0), (10.5, 0), (11.2, 1), (13.0, 1), (20.6, 1), (21.5, 2)])
+
+    def test_drops_blank_pieces_and_strips_text(self):
+        stitched = stitch([[piece(0, 1, "  hello "), piece(1, 2, "   ")]], [(0.0, 2)], overlap=2)
+        self.assertEqual(stitched, [{"start": 0, "end": 1, "text": "hello", "segment": 0}])
+
+    def test_every_word_survives_segmentation(self):
+        # One word per second, transcribed segment by segment, comes back whole.
+        duration, words = 41.0, [float(t) for t in range(41)]
+        plan = plan_segments(duration, segment=10, overlap=3)
+        results = [[piece(t - start, t - start + 0.5, f"w{int(t)}") for t in words if start <= t < start + length]
+                   for start, length in plan]
+        stitched = stitch(results, plan, overlap=3)
+        self.assertEqual([p["text"] for p in stitched], [f"w{int(t)}" for t in words])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import os, json, hashlib, shutil, subprocess, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from dotenv import load_dotenv
+from openai import OpenAI
+from langchain_core.documents import Document
+from chunking import chunk_settings
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "openai")  # "openai" or "stub"
+TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "whisper-1")
+TRANSCRIBE_SEGMENT_SECONDS = float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "600"))
+TRANSCRIBE_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "5"))
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "4"))
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", "transcript_cache")
+API_MAX_BYTES = 25 * 1024 * 1024  # whisper-1 upload limit
+
+
+class OpenAITranscriber:
+    # Returns [{"start", "end", "text"}] with times relative to the file.
+
+    def __init__(self, model: str = TRANSCRIBE_MODEL):
+        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.model = model
+
+    def transcribe(self, path: str) -> List[dict]:
+        with open(path, "rb") as f:
+            result = self.client.audio.transcriptions.create(
+                model=self.model, file=f, response_format="verbose_json", timestamp_granularities=["segment"]
+            )
+        segments = getattr(result, "segments", None) or []
+        if not segments:
+            return [{"start": 0.0, "end": getattr(result, "duration", 0.0) or 0.0, "text": result.text}]
+        return [{"start": float(s.start), "end": float(s.end), "text": s.text.strip()} for s in segments]
+
+
+class StubTranscriber:
+    # Offline backend for tests and benchmarks: one line of fake text per 30s.
+
+    model = "stub"
+
+    def transcribe(self, path: str) -> List[dict]:
+        duration = probe_duration(path) or 30.0
+        name = os.path.basename(path)
+        pieces, start = [], 0.0
+        while start < duration:
+            end = min(start + 30.0, duration)
+            pieces.append({"start": start, "end": end, "text": f"{name} from {start:.0f}s to {end:.0f}s."})
+            start = end
+        return pieces
+
+
+def get_transcriber(backend: str = TRANSCRIBE_BACKEND):
+    if backend == "stub":
+        return StubTranscriber()
+    if backend == "openai":
+        return OpenAITranscriber()
+    raise ValueError(f"Unknown TRANSCRIBE_BACKEND: {backend}")
+
+
+def probe_duration(path: str) -> Optional[float]:
+    if not shutil.which("ffprobe"):
+        return None
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path],
+        capture_output=True, text=True,
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def extract_segment(path: str, start: float, length: float, out_path: str):
+    # Mono 16 kHz 64 kbit/s MP3: ten minutes is ~5 MB, well under the API limit.
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path,
+         "-vn", "-ac", "1", "-ar", "16000", "-b:a", "64k", out_path],
+        check=True, capture_output=True,
+    )
+
+
+def plan_segments(duration: float, segment: float = TRANSCRIBE_SEGMENT_SECONDS,
+                  overlap: float = TRANSCRIBE_OVERLAP_SECONDS) -> List[tuple]:
+    # [(start, length)] covering the file; neighbours share `overlap` seconds
+    # so no word is lost at a cut. Stops at the segment that reaches the end:
+    # a tail shorter than the overlap would be dropped by stitch() on both sides.
+    segments, start = [], 0.0
+    while start < duration:
+        length = min(segment + overlap, duration - start)
+        segments.append((start, length))
+        if start + length >= duration:
+            break
+        start += segment
+    return segments
+
+
+def stitch(results: List[List[dict]], plan: List[tuple], overlap: float = TRANSCRIBE_OVERLAP_SECONDS) -> List[dict]:
+    # Each overlap is transcribed twice; keep a piece only from the segment
+    # where it starts before the overlap's midpoint.
+    stitched = []
+    for index, ((offset, length), pieces) in enumerate(zip(plan, results)):
+        low = overlap / 2 if index > 0 else float("-inf")
+        high = length - overlap / 2 if index < len(plan) - 1 else float("inf")
+        for piece in pieces:
+            if low <= piece["start"] < high and piece["text"].strip():
+                stitched.append({"start": offset + piece["start"], "end": offset + piece["end"],
+                                 "text": piece["text"].strip(), "segment": index})
+    return stitched
+
+
+def timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def transcript_documents(pieces: List[dict]) -> List[Document]:
+    # Groups consecutive pieces into chunk-sized documents, each prefixed with
+    # its time range so answers can point at the right minute.
+    max_chars, _ = chunk_settings("media")
+    docs, group = [], []
+
+    def flush():
+        if group:
+            start, end = group[0]["start"], group[-1]["end"]
+            text = f"[{timestamp(start)}–{timestamp(end)}] " + " ".join(piece["text"] for piece in group)
+            docs.append(Document(page_content=text, metadata={
+                "start_seconds": round(start, 2), "end_seconds": round(end, 2),
+                "segment": group[0]["segment"], "chunking": "media",
+            }))
+            group.clear()
+
+    for piece in pieces:
+        if group and sum(len(p["text"]) + 1 for p in group) + len(piece["text"]) > max_chars:
+            flush()
+        group.append(piece)
+    flush()
+    return docs
+
+
+def _cache_path(content_hash: str, model: str) -> str:
+    return os.path.join(TRANSCRIPT_CACHE_DIR, f"{content_hash}.{model}.json")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def transcribe_media(path: str, content_hash: Optional[str] = None, transcriber=None) -> List[Document]:
+    transcriber = transcriber or get_transcriber()
+    content_hash = content_hash or file_sha256(path)
+    cache_path = _cache_path(content_hash, transcriber.model)
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            pieces = json.load(f)
+        print(f"[🎙️ Transcript Cache Hit] {os.path.basename(path)}")
+        return transcript_documents(pieces)
+
+    duration = probe_duration(path)
+    if duration is None or not shutil.which("ffmpeg"):
+        # Without ffmpeg we can only send the file as is.
+        if os.path.getsize(path) > API_MAX_BYTES:
+            raise RuntimeError("ffmpeg/ffprobe are required to split media larger than 25 MB")
+        plan, results = [(0.0, duration or 0.0)], [transcriber.transcribe(path)]
+    else:
+        plan = plan_segments(duration)
+        workdir = tempfile.mkdtemp(prefix="segments-", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            def run(indexed):
+                index, (start, length) = indexed
+                segment_path = os.path.join(workdir, f"{index:04d}.mp3")
+                extract_segment(path, start, length, segment_path)
+                return transcriber.transcribe(segment_path)
+
+            with ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS) as executor:
+                results = list(executor.map(run, enumerate(plan)))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"[🎙️ Transcribed] {os.path.basename(path)}: {duration:.0f}s in {len(plan)} segment(s)")
+
+    pieces = stitch(results, plan)
+    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(pieces, f)
+    os.replace(tmp_path, cache_path)
+    return transcript_documents(pieces)
@@ -1,39 +1,16 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import PlainTextResponse
-from create_vectordb import main as full_refresh
-import threading, time
+from create_vectordb import reindex_from_notifications
+from sync_queue import CoalescingQueue
+from metrics import incr, render_prometheus, set_gauge
+import time
 
 app = FastAPI()
 
-lock = threading.Lock()
-is_cooldown = False
-cooldown_timer = None
-
-def reset_cooldown():
-    global is_cooldown
-    print("🔁 Cooldown period ended.")
-    is_cooldown = False
-
-def run_main_with_lock():
-    global is_cooldown, cooldown_timer
-
-    if lock.locked():
-        print("⏳ Already processing. Skipping...")
-        return
-
-    with lock:
-        print("🚀 Starting full_refresh()")
-        start = time.time()
-        full_refresh()
-        end = time.time()
-        duration = end - start
-
-        print(f"✅ main() completed in {duration:.2f} seconds")
-
-        # Set cooldown for same duration (or a safe buffer like +5 sec)
-        is_cooldown = True
-        cooldown_timer = threading.Timer(duration + 5, reset_cooldown)
-        cooldown_timer.start()
+# Bursts of notifications collapse into a single pending sync; a notification
+# that arrives mid-run guarantees exactly one follow-up run after it. Each run
+# reindexes only the items the coalesced notifications point at.
+sync_queue = CoalescingQueue(reindex_from_notifications)
 
 @app.api_route("/webhook", methods=["GET", "POST"])
 async def webhook(request: Request):
@@ -43,16 +20,29 @@ async def webhook(request: Request):
         return PlainTextResponse(content=validation_token, status_code=200)
 
     try:
+        received_at = time.time()
         data = await request.json()
         print("📩 Webhook notification received:", data)
 
-        if not is_cooldown:
-            print("⚡ Debounce clear — running full_refresh()")
-            threading.Thread(target=run_main_with_lock).start()
-        else:
-            print("🛑 Cooldown active — skipping execution")
+        notifications = data.get("value") or [{}]
+        incr("webhook_notifications_total", len(notifications))
+        sync_queue.enqueue(notifications, received_at)
+        print(f"📬 Queued {len(notifications)} notification(s) for the next sync run")
 
     except Exception as e:
         print("❌ Failed to handle webhook:", e)
 
     return {"status": "received"}
+
+@app.get("/queue")
+async def queue_status():
+    return sync_queue.stats()
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: ingest spans and counters from this process's
+    # sync runs, plus the queue state as gauges.
+    for key, value in sync_queue.stats().items():
+        if isinstance(value, (int, float)):
+            set_gauge(f"sync_queue_{key}", float(value))
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")